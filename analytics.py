@@ -0,0 +1,142 @@
+import threading
+
+import numpy as np
+from sqlalchemy import func, select
+
+from database import PokerGame, game_players_association, get_data_generation, get_games_deleted
+
+# Колоночный снимок истории игр в памяти процесса. Статистика считается векторными
+# операциями NumPy по массивам, а не циклами по ORM-объектам.
+# Снимок сверяется с поколением данных: новые игры догружаются по id, после удаления
+# игр (счетчик games_deleted в bot_meta) снимок загружается заново.
+
+
+class GameColumns:
+    # Неизменяемый вид снимка: строка i — игра ids[i], игры упорядочены по id.
+    # Участники хранятся в формате CSR: участники игры i — participants[indptr[i]:indptr[i + 1]],
+    # rows[k] — номер игры участника participants[k].
+
+    def __init__(self, ids, dates, winners, seconds, banks, buyins, indptr, participants):
+        self.ids = ids
+        self.dates = dates
+        self.winners = winners
+        self.seconds = seconds
+        self.banks = banks
+        self.buyins = buyins
+        self.indptr = indptr
+        self.participants = participants
+        self.rows = np.repeat(np.arange(len(ids)), np.diff(indptr))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def date_mask(self, start=None, end=None):
+        # Игры в окне дат [start, end]
+        mask = np.ones(len(self.ids), dtype=bool)
+        if start is not None:
+            mask &= self.dates >= start.toordinal()
+        if end is not None:
+            mask &= self.dates <= end.toordinal()
+        return mask
+
+    def player_games(self, player_id):
+        # Номера игр, в которых участвовал игрок, по возрастанию
+        return np.unique(self.rows[self.participants == player_id])
+
+    def latest(self, indexes, count):
+        # count самых поздних по дате игр из indexes
+        order = np.argsort(-self.dates[indexes], kind='stable')
+        return indexes[order[:count]]
+
+
+def _empty_columns():
+    return GameColumns(
+        np.empty(0, np.int64), np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.int32),
+        np.empty(0, np.float64), np.empty(0, np.float64), np.zeros(1, np.int64), np.empty(0, np.int32),
+    )
+
+
+def _load_columns(session, after_id):
+    # Игры с id больше after_id и их участники
+    games = session.execute(
+        select(
+            PokerGame.id, PokerGame.date, PokerGame.winner_id, PokerGame.second_place_id,
+            PokerGame.bank, PokerGame.buyin,
+        ).where(PokerGame.id > after_id).order_by(PokerGame.id)
+    ).all()
+    links = session.execute(
+        select(game_players_association.c.game_id, game_players_association.c.player_id)
+        .where(game_players_association.c.game_id > after_id)
+        .order_by(game_players_association.c.game_id)
+    ).all()
+
+    ids = np.fromiter((row[0] for row in games), np.int64, len(games))
+    link_games = np.fromiter((row[0] for row in links), np.int64, len(links))
+    # Связи с играми, которых нет (например, удаленных без каскада), отбрасываются
+    known = np.isin(link_games, ids)
+    link_games = link_games[known]
+    participants = np.fromiter((row[1] for row in links), np.int32, len(links))[known]
+    counts = np.bincount(np.searchsorted(ids, link_games), minlength=len(ids))
+
+    return GameColumns(
+        ids,
+        np.fromiter((row[1].toordinal() for row in games), np.int32, len(games)),
+        np.fromiter((-1 if row[2] is None else row[2] for row in games), np.int32, len(games)),
+        np.fromiter((-1 if row[3] is None else row[3] for row in games), np.int32, len(games)),
+        np.fromiter((row[4] or 0 for row in games), np.float64, len(games)),
+        np.fromiter((row[5] or 0 for row in games), np.float64, len(games)),
+        np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+        participants,
+    )
+
+
+def _append(old, new):
+    if not len(new):
+        return old
+    if not len(old):
+        return new
+    return GameColumns(
+        np.concatenate((old.ids, new.ids)),
+        np.concatenate((old.dates, new.dates)),
+        np.concatenate((old.winners, new.winners)),
+        np.concatenate((old.seconds, new.seconds)),
+        np.concatenate((old.banks, new.banks)),
+        np.concatenate((old.buyins, new.buyins)),
+        np.concatenate((old.indptr, new.indptr[1:] + old.indptr[-1])),
+        np.concatenate((old.participants, new.participants)),
+    )
+
+
+class GameSnapshot:
+    def __init__(self):
+        self._columns = _empty_columns()
+        self._generation = None
+        self._deleted = None
+        self._lock = threading.Lock()
+
+    def refresh(self, session):
+        # Возвращает снимок, соответствующий базе. Обычно это одна проверка поколения данных.
+        # Поколение читается до игр: если игра добавится между запросами, следующая проверка ее догрузит.
+        generation = get_data_generation(session)
+        if generation == self._generation:
+            return self._columns
+
+        with self._lock:
+            if generation == self._generation:
+                return self._columns
+            # Удаленная последняя игра и добавленная после нее получают один id,
+            # поэтому после любого удаления снимок загружается заново, а не догружается
+            deleted = get_games_deleted(session)
+            columns = self._columns if deleted == self._deleted else _empty_columns()
+            last_id = int(columns.ids[-1]) if len(columns) else 0
+            columns = _append(columns, _load_columns(session, last_id))
+            if session.query(func.count(PokerGame.id)).scalar() != len(columns):
+                # Игры удалялись в обход delete_game: загружаем снимок заново
+                columns = _load_columns(session, 0)
+            self._columns = columns
+            self._generation = generation
+            self._deleted = deleted
+            return columns
+
+
+game_snapshot = GameSnapshot()
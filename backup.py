@@ -0,0 +1,98 @@
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+import config
+from database import init_db
+from storage import is_file_database
+
+logger = logging.getLogger(__name__)
+
+# Горячие резервные копии базы через backup API SQLite: копия снимается с работающей базы
+# без остановки бота. В режиме WAL чтение для копии не мешает записи, поэтому копия
+# делается за один шаг и получается согласованным снимком.
+# Файлы копий: <каталог>/poker_games-ГГГГММДД-ЧЧММСС.db, хранятся последние config.BACKUP_KEEP.
+
+BACKUP_PREFIX = 'poker_games-'
+BACKUP_SUFFIX = '.db'
+
+
+class BackupResult:
+    def __init__(self, path, size, seconds, removed):
+        self.path = path
+        self.size = size
+        self.seconds = seconds
+        # Старые копии, удаленные при ротации
+        self.removed = removed
+
+
+def list_backups(directory):
+    # Копии по возрастанию времени (имя файла сортируется как время)
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX)
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def _rotate(directory, keep):
+    # keep <= 0 — хранить все копии
+    backups = list_backups(directory)
+    removed = []
+    for path in backups[:-keep] if keep > 0 else []:
+        try:
+            os.remove(path)
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def backup_database(engine, directory=None, keep=None):
+    directory = directory or config.BACKUP_DIR
+    keep = config.BACKUP_KEEP if keep is None else keep
+    if not is_file_database(engine):
+        raise RuntimeError("Резервные копии поддерживаются только для базы SQLite в файле")
+    os.makedirs(directory, exist_ok=True)
+
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(directory, f'{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}')
+    tmp_path = f'{path}.tmp'
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        target = sqlite3.connect(tmp_path)
+        try:
+            connection.connection.driver_connection.backup(target)
+            # Копия — один самостоятельный файл, без -wal и -shm рядом
+            target.execute("PRAGMA journal_mode = DELETE")
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            target.close()
+    if check != 'ok':
+        os.remove(tmp_path)
+        raise RuntimeError(f"Копия базы не прошла проверку: {check}")
+    os.replace(tmp_path, path)
+    seconds = time.perf_counter() - started
+    return BackupResult(path, os.path.getsize(path), seconds, _rotate(directory, keep))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервная копия базы данных")
+    parser.add_argument('--dir', default=config.BACKUP_DIR or 'backups',
+                        help="каталог для копий (по умолчанию POKERBOT_BACKUP_DIR или backups)")
+    parser.add_argument('--keep', type=int, default=config.BACKUP_KEEP, help="сколько копий хранить")
+    args = parser.parse_args()
+
+    result = backup_database(init_db(), args.dir, args.keep)
+    print(f"Копия {result.path}: {result.size} байт за {result.seconds:.2f} с")
+    for path in result.removed:
+        print(f"Удалена старая копия {path}")
+
+
+if __name__ == '__main__':
+    main()
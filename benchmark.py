@@ -0,0 +1,560 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import Session
+from telegram.request import BaseRequest
+
+import config
+from migrations import migrate
+from database import (
+    PokerGame, Player, RatingSnapshot, Season, game_players_association, get_session,
+    add_game, delete_game, season_points,
+)
+from ratings import rebuild_ratings
+from search import rebuild_search_index
+from seasons import list_seasons, rebuild_all_season_results, rebuild_season_results, season_leaderboard
+from stats import rebuild_rollup
+
+# Замеры скорости на синтетической базе: python benchmark.py season-points --games 5000
+
+CITIES = ['Санкт-Петербург', 'Архангельск', 'Выборг']
+# Сезон на всю историю для замера season-points
+BENCHMARK_SEASON = 'Бенчмарк'
+
+
+def generate_synthetic_db(path, games=5000, players=50, participants=6, seed=1):
+    # Создает базу с заданным числом игр и игроков, даты идут подряд с 2023 года
+    engine = create_engine(f'sqlite:///{path}')
+    migrate(engine)
+    rnd = random.Random(seed)
+    names = [f'Игрок {i}' for i in range(1, players + 1)]
+    start = date(2023, 1, 1)
+
+    with engine.begin() as connection:
+        # Вместо состава, с которым создается новая база, — синтетические игроки
+        connection.execute(Player.__table__.delete())
+        connection.execute(Player.__table__.insert(), [
+            {'id': i, 'name': name} for i, name in enumerate(names, 1)
+        ])
+
+        game_rows = []
+        association_rows = []
+        for game_id in range(1, games + 1):
+            seats = rnd.sample(range(1, players + 1), min(participants, players))
+            buyin = rnd.choice([100.0, 200.0, 500.0])
+            rebuys = rnd.randint(0, 10)
+            game_rows.append({
+                'id': game_id,
+                'date': start + timedelta(days=game_id // 3),
+                'city': rnd.choice(CITIES),
+                'players_count': len(seats),
+                'winner': names[seats[0] - 1],
+                'second_place': names[seats[1] - 1],
+                'winner_id': seats[0],
+                'second_place_id': seats[1],
+                'rebuys': rebuys,
+                'bank': (len(seats) + rebuys) * buyin,
+                'buyin': buyin,
+                'big_blind': rnd.choice([10, 20, 50]),
+                'description': None,
+            })
+            association_rows.extend({'game_id': game_id, 'player_id': seat} for seat in seats)
+
+        connection.execute(PokerGame.__table__.insert(), game_rows)
+        connection.execute(game_players_association.insert(), association_rows)
+
+        # Накопленная статистика и поисковый индекс, как после импорта
+        session = Session(bind=connection)
+        rebuild_rollup(session)
+        rebuild_all_season_results(session)
+        rebuild_ratings(session)
+        session.flush()
+        rebuild_search_index(connection)
+
+    return engine
+
+
+def _season_points_per_player(session, start_date, end_date):
+    # Прежний вариант show_season_points: отдельный запрос на каждого игрока
+    player_stats = []
+    for player in session.query(Player).all():
+        season_games = session.query(PokerGame)\
+            .join(PokerGame.players)\
+            .filter(
+                Player.id == player.id,
+                PokerGame.date >= start_date,
+                PokerGame.date <= end_date
+            ).all()
+        if not season_games:
+            continue
+        wins = len([g for g in season_games if g.winner == player.name])
+        seconds = len([g for g in season_games if g.second_place == player.name])
+        total_games = len(season_games)
+        player_stats.append((player.name, season_points(wins, seconds, total_games), wins, seconds, total_games))
+    return sorted(player_stats)
+
+
+def _season_points_results(session, season_name):
+    # Как show_season_points: сезон по названию, список сезонов для клавиатуры и итоги из season_results
+    season = session.query(Season).filter_by(name=season_name).first()
+    list_seasons(session)
+    return sorted(season_leaderboard(session, season))
+
+
+def _add_benchmark_season(engine, start_date, end_date):
+    # Сезон на всю синтетическую историю; его итоги считаются так же, как при добавлении сезона
+    session = get_session(engine)
+    season = Season(name=BENCHMARK_SEASON, start_date=start_date, end_date=end_date)
+    session.add(season)
+    session.flush()
+    rebuild_season_results(session, season)
+    session.commit()
+    session.close()
+
+
+def _measure(func, engine, *args, repeat=5):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        session = get_session(engine)
+        started = time.perf_counter()
+        result = func(session, *args)
+        timings.append(time.perf_counter() - started)
+        session.close()
+    return min(timings), result
+
+
+def bench_season_points(args):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = generate_synthetic_db(
+            os.path.join(directory, 'poker_games.db'),
+            games=args.games, players=args.players, participants=args.participants
+        )
+        start_date, end_date = date(2023, 1, 1), date(2100, 1, 1)
+
+        _add_benchmark_season(engine, start_date, end_date)
+
+        loop_time, loop_result = _measure(_season_points_per_player, engine, start_date, end_date)
+        results_time, results_result = _measure(_season_points_results, engine, BENCHMARK_SEASON)
+        engine.dispose()
+
+    assert loop_result == results_result, "Результаты запросов не совпадают"
+    print(f"Игр: {args.games}, игроков: {args.players}, участников в игре: {args.participants}")
+    print(f"Запрос на каждого игрока: {loop_time * 1000:.1f} мс")
+    print(f"Итоги из season_results: {results_time * 1000:.1f} мс")
+    print(f"Ускорение: x{loop_time / results_time:.1f}")
+
+
+class StubRequest(BaseRequest):
+    # Заглушка Bot API: отвечает на запросы бота локально и запоминает, когда ушел каждый ответ
+    def __init__(self):
+        self.replies = asyncio.Queue()
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'pokerbot', 'username': 'pokerbot'}
+        elif api_method.startswith('send'):
+            self._message_id += 1
+            result = {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(parameters.get('chat_id', 0)), 'type': 'private'},
+            }
+            if api_method == 'sendPhoto':
+                result['photo'] = [{'file_id': f'photo{self._message_id}', 'file_unique_id': 'u', 'width': 1, 'height': 1}]
+            self.replies.put_nowait((result['chat']['id'], time.perf_counter()))
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def fake_update(update_id, chat_id, text):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def _percentiles(timings):
+    timings = sorted(timings)
+    pick = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))]
+    return f"p50 {pick(0.5) * 1000:.1f} мс, p95 {pick(0.95) * 1000:.1f} мс, max {timings[-1] * 1000:.1f} мс"
+
+
+async def _bench_webhook(args):
+    from telegram.ext import Application
+    import bot
+
+    stub = StubRequest()
+    builder = Application.builder().token('1:bench').request(stub).get_updates_request(StubRequest())
+    application = bot.build_application(builder)
+    secret = 'bench-secret'
+    url = f'http://127.0.0.1:{args.port}/telegram'
+
+    async with application:
+        await application.updater.start_webhook(
+            listen='127.0.0.1', port=args.port, url_path='telegram', secret_token=secret
+        )
+        await application.start()
+        try:
+            await _post_fake_updates(args, stub, url, secret)
+        finally:
+            await application.updater.stop()
+            await application.stop()
+
+
+async def _post_fake_updates(args, stub, url, secret):
+    import httpx
+
+    update_id = 0
+    async with httpx.AsyncClient() as client:
+        # Все чаты отправляют /start, затем 'Последние игры'; замеряется время от запроса до ответа бота
+        for text in ['/start', 'Последние игры']:
+            sent = {}
+            for chat_id in range(1, args.chats + 1):
+                update_id += 1
+                sent[chat_id] = time.perf_counter()
+                response = await client.post(
+                    url, json=fake_update(update_id, chat_id, text),
+                    headers={'X-Telegram-Bot-Api-Secret-Token': secret}
+                )
+                assert response.status_code == 200, response.status_code
+            timings = []
+            while len(timings) < args.chats:
+                chat_id, replied = await asyncio.wait_for(stub.replies.get(), timeout=30)
+                timings.append(replied - sent[chat_id])
+            print(f"{text}: {_percentiles(timings)}")
+
+        rejected = await client.post(url, json=fake_update(update_id + 1, 1, '/start'))
+        print(f"Запрос без секрета отклонен с кодом {rejected.status_code}")
+
+
+def _use_database(path):
+    # config уже загружен вместе с database, поэтому настройки меняются в самом модуле.
+    # bot подключается к базе при импорте, то есть после этого вызова.
+    config.DB_URL = f'sqlite:///{path}'
+    config.CHART_WORKERS = 0
+
+
+def bench_webhook(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'poker_games.db')
+        generate_synthetic_db(path, games=args.games, players=args.players).dispose()
+        _use_database(path)
+        print(f"Webhook: {args.chats} чатов одновременно, игр в базе: {args.games}")
+        asyncio.run(_bench_webhook(args))
+
+
+def _new_game_data():
+    # Данные диалога добавления игры перед последним шагом (add_description)
+    seats = [f'Игрок {i}' for i in range(1, 7)]
+    return {
+        'game_date': date(2025, 7, 1), 'city': CITIES[0], 'players_count': len(seats),
+        'winner': seats[0], 'second_place': seats[1], 'selected_players': seats[2:],
+        'rebuys': 2, 'buyin': 100.0, 'big_blind': 20, 'bank': 800.0,
+    }
+
+
+# (обработчик, текст сообщения, данные диалога перед вызовом).
+# add_description добавляет игры, поэтому идет последним: остальные замеры идут на исходной базе.
+HANDLER_SCENARIOS = [
+    ('show_recent_games', 'Последние игры', None),
+    ('show_all_stats', 'все', None),
+    ('show_season_points', 'Очки сезона', None),
+    ('show_player_stats', 'Игрок 1', None),
+    ('search_game', 'Игрок 7', None),
+    ('search_game', '01.07.2025', None),
+    ('show_ratings', 'Рейтинг', None),
+    ('add_description', '-', _new_game_data),
+]
+
+
+# Обработчики, ответы которых кэшируются в bot.response_cache
+CACHED_HANDLERS = {'show_recent_games', 'show_all_stats', 'show_season_points', 'show_player_stats'}
+
+
+async def _bench_handler(application, bot, queries, name, text, user_data, cached, update_id, repeat):
+    from telegram import Update
+    from telegram.ext import CallbackContext
+
+    handler = getattr(bot, name)
+    timings = []
+    counts = []
+    # Первый вызов прогревает кэши и не учитывается
+    for iteration in range(repeat + 1):
+        update_id += 1
+        update = Update.de_json(fake_update(update_id, 1, text), application.bot)
+        context = CallbackContext.from_update(update, application)
+        context.user_data.clear()
+        if user_data:
+            context.user_data.update(user_data())
+        if not cached:
+            bot.response_cache.clear()
+        queries[0] = 0
+        started = time.perf_counter()
+        await handler(update, context)
+        if iteration:
+            timings.append(time.perf_counter() - started)
+            counts.append(queries[0])
+    return update_id, timings, counts
+
+
+async def _bench_handlers(args):
+    from telegram.ext import Application
+    import bot
+
+    queries = [0]
+
+    @event.listens_for(bot.engine, 'before_cursor_execute')
+    def count_query(*_):
+        queries[0] += 1
+
+    application = Application.builder().token('1:bench').request(StubRequest())\
+        .get_updates_request(StubRequest()).build()
+    results = {}
+    update_id = 0
+    async with application:
+        for name, text, user_data in HANDLER_SCENARIOS:
+            # Без кэша ответов замеряется работа обработчика и базы; повторные нажатия
+            # кнопок, которые отвечаются из кэша, — отдельной строкой
+            for cached in (False, True) if name in CACHED_HANDLERS else (False,):
+                label = f"{name} ({text})" + (", из кэша" if cached else "")
+                update_id, timings, counts = await _bench_handler(
+                    application, bot, queries, name, text, user_data, cached, update_id, args.repeat)
+                results[label] = {
+                    'p50_ms': statistics.median(timings) * 1000,
+                    'p95_ms': sorted(timings)[min(len(timings) - 1, int(0.95 * len(timings)))] * 1000,
+                    'max_ms': max(timings) * 1000,
+                    'queries': statistics.mean(counts),
+                }
+                print(f"{label}: {_percentiles(timings)}, SQL-запросов: {statistics.mean(counts):.1f}")
+    return results
+
+
+def bench_handlers(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'poker_games.db')
+        started = time.perf_counter()
+        generate_synthetic_db(
+            path, games=args.games, players=args.players, participants=args.participants
+        ).dispose()
+        print(f"Игр: {args.games}, игроков: {args.players}, участников в игре: {args.participants} "
+              f"(база создана за {time.perf_counter() - started:.1f} с), вызовов на обработчик: {args.repeat}")
+        _use_database(path)
+        results = asyncio.run(_bench_handlers(args))
+
+    if args.json:
+        # Результаты разных версий можно сравнивать между собой
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'games': args.games, 'players': args.players, 'participants': args.participants,
+                       'handlers': results}, file, ensure_ascii=False, indent=2)
+
+
+def _time_import(code, env, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=env, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def bench_startup(args):
+    # Холодный запуск: каждый замер — новый процесс интерпретатора, который импортирует бота
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'poker_games.db')
+        generate_synthetic_db(path, games=100).dispose()
+        env = dict(os.environ, POKERBOT_DB_URL=f'sqlite:///{path}', POKERBOT_CHART_WORKERS='0')
+
+        lazy = _time_import("import bot, sys; assert 'matplotlib' not in sys.modules", env, args.repeat)
+        # Так бот запускался, пока matplotlib импортировался вместе с модулем диаграмм
+        eager = _time_import("import bot, chart_rendering", env, args.repeat)
+
+    print(f"Запуск без matplotlib: {lazy * 1000:.0f} мс")
+    print(f"Запуск с matplotlib: {eager * 1000:.0f} мс")
+    print(f"Выигрыш: {(eager - lazy) * 1000:.0f} мс")
+
+
+def _write_import_csv(path, games, players, participants, seed=1):
+    # Выгрузка в формате importer.py, несколько строк намеренно с ошибками
+    rnd = random.Random(seed)
+    names = [f'Игрок {i}' for i in range(1, players + 1)]
+    start = date(2023, 1, 1)
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['date', 'city', 'players_count', 'winner', 'second_place',
+                         'rebuys', 'buyin', 'big_blind', 'description', 'participants'])
+        for number in range(games):
+            seats = rnd.sample(names, min(participants, players))
+            buyin = rnd.choice(['100', '200', '500']) if number % 1000 != 999 else 'много'
+            writer.writerow([
+                (start + timedelta(days=number // 3)).strftime('%d.%m.%Y'), rnd.choice(CITIES), len(seats),
+                seats[0], seats[1], rnd.randint(0, 10), buyin, rnd.choice([10, 20, 50]), '', ';'.join(seats),
+            ])
+
+
+def bench_import(args):
+    from importer import import_games, read_rows
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.csv')
+        _write_import_csv(path, args.games, args.players, args.participants)
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'poker_games.db')}")
+        migrate(engine)
+
+        started = time.perf_counter()
+        imported, errors = import_games(engine, read_rows(path), args.batch_size)
+        elapsed = time.perf_counter() - started
+        engine.dispose()
+
+    print(f"Игр в файле: {args.games}, пачка: {args.batch_size}")
+    print(f"Импортировано: {imported}, строк с ошибками: {len(errors)}, время: {elapsed:.2f} с "
+          f"({imported / elapsed:.0f} игр/с)")
+
+
+def _rating_rows(session):
+    return sorted(session.query(RatingSnapshot.game_id, RatingSnapshot.player_id, RatingSnapshot.rating).all())
+
+
+def _time_game_change(engine, day, repeat):
+    # Добавление и удаление одной игры с датой day, каждое в своей откатываемой транзакции
+    add_times, delete_times = [], []
+    for _ in range(repeat):
+        session = get_session(engine)
+        players = session.query(Player).order_by(Player.id).limit(6).all()
+        game = PokerGame(
+            date=day, city=CITIES[0], players_count=len(players), rebuys=0, bank=600.0, buyin=100.0,
+            big_blind=20, winner=players[0].name, second_place=players[1].name,
+            winner_player=players[0], second_place_player=players[1],
+        )
+        game.players.extend(players)
+        started = time.perf_counter()
+        add_game(session, game)
+        add_times.append(time.perf_counter() - started)
+        session.rollback()
+
+        game = session.query(PokerGame).filter(PokerGame.date >= day).order_by(PokerGame.date, PokerGame.id).first()
+        started = time.perf_counter()
+        delete_game(session, game)
+        session.flush()
+        delete_times.append(time.perf_counter() - started)
+        session.rollback()
+        session.close()
+    return min(add_times), min(delete_times)
+
+
+def bench_ratings(args):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = generate_synthetic_db(
+            os.path.join(directory, 'poker_games.db'),
+            games=args.games, players=args.players, participants=args.participants
+        )
+        session = get_session(engine)
+        last_day = session.query(func.max(PokerGame.date)).scalar()
+        first_day = session.query(func.min(PokerGame.date)).scalar()
+
+        # Добавление и удаление игры в середине истории должны дать то же, что полный пересчет
+        middle = session.query(PokerGame).order_by(PokerGame.id).offset(args.games // 2).first()
+        delete_game(session, middle)
+        session.flush()
+        incremental = _rating_rows(session)
+        started = time.perf_counter()
+        rebuild_ratings(session)
+        rebuild_time = time.perf_counter() - started
+        assert incremental == _rating_rows(session), "Инкрементальный пересчет не совпадает с полным"
+        session.rollback()
+        session.close()
+
+        timings = [
+            ('в конец истории', _time_game_change(engine, last_day, args.repeat)),
+            ('в середину истории', _time_game_change(engine, first_day + (last_day - first_day) / 2, args.repeat)),
+            ('в начало истории', _time_game_change(engine, first_day, args.repeat)),
+        ]
+        engine.dispose()
+
+    print(f"Игр: {args.games}, игроков: {args.players}, участников в игре: {args.participants}")
+    print(f"Полный пересчет рейтинга: {rebuild_time * 1000:.1f} мс")
+    for label, (add_time, delete_time) in timings:
+        print(f"Игра {label}: добавление {add_time * 1000:.1f} мс, удаление {delete_time * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры скорости обработчиков бота")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    season = subparsers.add_parser('season-points', help="Очки сезона: запрос на игрока против итогов из season_results")
+    season.add_argument('--games', type=int, default=5000)
+    season.add_argument('--players', type=int, default=50)
+    season.add_argument('--participants', type=int, default=6)
+    season.set_defaults(func=bench_season_points)
+
+    webhook = subparsers.add_parser('webhook', help="Задержка ответа при работе через webhook")
+    webhook.add_argument('--chats', type=int, default=20)
+    webhook.add_argument('--games', type=int, default=1000)
+    webhook.add_argument('--players', type=int, default=30)
+    webhook.add_argument('--port', type=int, default=8089)
+    webhook.set_defaults(func=bench_webhook)
+
+    handlers = subparsers.add_parser('handlers', help="Задержка и число SQL-запросов каждого обработчика")
+    handlers.add_argument('--games', type=int, default=100000)
+    handlers.add_argument('--players', type=int, default=500)
+    handlers.add_argument('--participants', type=int, default=6)
+    handlers.add_argument('--repeat', type=int, default=20)
+    handlers.add_argument('--json', help="сохранить результаты в файл")
+    handlers.set_defaults(func=bench_handlers)
+
+    startup = subparsers.add_parser('startup', help="Время запуска бота (импорт модулей)")
+    startup.add_argument('--repeat', type=int, default=5)
+    startup.set_defaults(func=bench_startup)
+
+    importing = subparsers.add_parser('import', help="Импорт истории игр из CSV")
+    importing.add_argument('--games', type=int, default=20000)
+    importing.add_argument('--players', type=int, default=50)
+    importing.add_argument('--participants', type=int, default=6)
+    importing.add_argument('--batch-size', type=int, default=1000)
+    importing.set_defaults(func=bench_import)
+
+    ratings = subparsers.add_parser('ratings', help="Пересчет рейтинга при добавлении и удалении игр")
+    ratings.add_argument('--games', type=int, default=20000)
+    ratings.add_argument('--players', type=int, default=50)
+    ratings.add_argument('--participants', type=int, default=6)
+    ratings.add_argument('--repeat', type=int, default=5)
+    ratings.set_defaults(func=bench_ratings)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InputFile
+from telegram.constants import ChatAction, MessageLimit
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -7,10 +8,38 @@ from telegram.ext import (
     ConversationHandler,
     filters
 )
-from database import init_db, get_session, PokerGame, Player, generate_pie_chart_stats, game_players_association
-from datetime import datetime
+from telegram.helpers import escape_markdown
+from telegram.request import HTTPXRequest
+from database import (
+    create_db_engine, run_db, run_blocking, unit_of_work, get_data_generation, data_generation_mirror, pie_chart_spec,
+    add_game, delete_game,
+    PokerGame, Player, PlayerStats, Season
+)
+from cache import ResultCache
+from charts import chart_service, chart_cache
+from stats import PARTICIPANTS_REQUEST_START_DATE
+from search import search_games
+from media import send_cached_photo
+from serving import PerChatUpdateProcessor, run_application
+from persistence import SQLitePersistence
+from analytics import game_snapshot
+from ratings import INITIAL_RATING, player_rating, rating_leaderboard
+from roster import roster_cache
+from seasons import current_season, list_seasons, season_leaderboard, season_period
+from exporter import export_games
+from maintenance import run_maintenance
+from migrations import migrate
+from backup import backup_database
+from metrics import (
+    InstrumentedRequest, instrument_conversation, instrument_engine, metrics_server, response_cache_requests
+)
+import config
+from datetime import date, datetime
 import logging
+import os
+import tempfile
 from collections import defaultdict
+from sqlalchemy.orm import selectinload
 
 # Настройка логирования
 logging.basicConfig(
@@ -19,17 +48,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация базы данных
-engine = init_db()
-session = get_session(engine)
-
-CITIES = ['Санкт-Петербург', 'Архангельск', 'Выборг']
-PLAYERS = ['Данила Бадецкий', 'Данил 72 Сергеев', 'Семен Попович', 
-            'Слава Харьков', 'Дмитрий Бедарев', 'Дмитрий Ляпин', 'Максим Мерзлый',
-            'Максим Гомозов', 'Богдан Светоносов', 'Евгений Черницкий', 'Роман Репняков',
-              'Аня Маславская']
-
-PARTICIPANTS_REQUEST_START_DATE = datetime.strptime('27.05.2025', '%d.%m.%Y').date()
+# Движок базы без обращения к ней: при импорте bot.py (в том числе процессами отрисовки
+# диаграмм, которые импортируют запущенный модуль как __mp_main__) база не открывается.
+# Схема проверяется и обновляется в build_application.
+engine = create_db_engine()
+# Каждое обновление работает в своей короткой сессии
+with_session = unit_of_work(engine)
+instrument_engine(engine)
 
 # Состояния бота
 (
@@ -54,6 +79,9 @@ PARTICIPANTS_REQUEST_START_DATE = datetime.strptime('27.05.2025', '%d.%m.%Y').da
     SEASON_POINTS,
 ) = range(19)
 
+# Имена состояний для меток метрик
+STATE_NAMES = {value: name for name, value in list(globals().items()) if name.isupper() and type(value) is int}
+
 # Создаем клавиатуры
 def get_main_keyboard():
     return ReplyKeyboardMarkup([
@@ -62,17 +90,59 @@ def get_main_keyboard():
         ['Удалить игру', 'Сезоны']
     ], resize_keyboard=True)
 
-def get_seasons_keyboard():
-    return ReplyKeyboardMarkup([
-        ['Очки сезона'],
-        ['Вернуться в главное меню']
-    ], resize_keyboard=True)
-
-def get_cities_keyboard():
-    return ReplyKeyboardMarkup([[city] for city in CITIES] + [['Отмена']], resize_keyboard=True)
+def get_seasons_keyboard(season_names=()):
+    return ReplyKeyboardMarkup(
+        [['Очки сезона', 'Рейтинг']] + [[name] for name in season_names] + [['Вернуться в главное меню']],
+        resize_keyboard=True
+    )
 
-def get_players_keyboard():
-    return ReplyKeyboardMarkup([[player] for player in PLAYERS] + [['Отмена']], resize_keyboard=True)
+async def get_roster():
+    # Состав и города с готовыми клавиатурами (roster.py); база проверяется не чаще
+    # раза в ROSTER_REFRESH_SECONDS, поэтому вызывается из обработчиков с with_session
+    roster = roster_cache.cached()
+    if roster is None:
+        roster = await run_db(roster_cache.refresh)
+    return roster
+
+# Готовые ответы меню по ключу (функция, аргументы, день, поколение данных).
+# День в ключе нужен ответам про текущий сезон, который определяется по дате.
+response_cache = ResultCache(config.RESPONSE_CACHE_SIZE)
+
+def _response_key(func, args, generation):
+    return (func.__name__, args, date.today(), generation)
+
+def _lookup_response(func, args, generation):
+    found, value = response_cache.get(_response_key(func, args, generation))
+    response_cache_requests.inc(func.__name__, 'hit' if found else 'miss')
+    return found, value
+
+def _build_cached_response(session, func, args, generation):
+    if generation is None:
+        generation = data_generation_mirror.refresh(session)
+        found, value = _lookup_response(func, args, generation)
+        if found:
+            return value
+    # Поколение прочитано до построения ответа: запись, которая успела между ними,
+    # увеличит поколение, и этот ответ больше не будет выбран
+    value = func(session, *args)
+    response_cache.put(_response_key(func, args, generation), value)
+    return value
+
+async def cached_db(func, *args):
+    # Как run_db, но ответ берется из кэша, пока поколение данных не изменилось.
+    # Повторное нажатие кнопки меню не обращается к базе вовсе.
+    generation = data_generation_mirror.cached()
+    if generation is not None:
+        found, value = _lookup_response(func, args, generation)
+        if found:
+            return value
+    return await run_db(_build_cached_response, func, args, generation)
+
+async def get_data_generation_cached():
+    generation = data_generation_mirror.cached()
+    if generation is None:
+        generation = await run_db(data_generation_mirror.refresh)
+    return generation
 
 async def check_cancel(update: Update, text: str) -> bool:
     if text == 'Отмена':
@@ -83,6 +153,25 @@ async def check_cancel(update: Update, text: str) -> bool:
         return True
     return False
 
+# Синхронные запросы к базе. Вызываются только через run_db и возвращают
+# готовые данные, чтобы обработчики не обращались к ORM-объектам из event loop.
+def _load_recent_games(session, limit):
+    games = session.query(PokerGame).order_by(PokerGame.date.desc()).limit(limit).all()
+    return [(game.id, game.date, game.winner) for game in games]
+
+def _load_games_by_date(session, date_obj):
+    games = session.query(PokerGame).filter(PokerGame.date == date_obj).all()
+    return [(game.id, game.winner, game.bank) for game in games]
+
+def _delete_game(session, game_id):
+    game = session.get(PokerGame, game_id)
+    if not game:
+        return None
+    deleted = (game.date, game.winner)
+    delete_game(session, game)
+    session.commit()
+    return deleted
+
 async def delete_game_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         if 'delete_options' in context.user_data:
@@ -102,6 +191,7 @@ async def delete_game_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("Ошибка при запуске удаления")
         return MAIN_MENU
 
+@with_session
 async def delete_game_execute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         text = update.message.text.strip()
@@ -110,7 +200,7 @@ async def delete_game_execute(update: Update, context: ContextTypes.DEFAULT_TYPE
             return await cancel(update, context)
             
         if text == 'Список':
-            games = session.query(PokerGame).order_by(PokerGame.date.desc()).limit(5).all()
+            games = await run_db(_load_recent_games, 5)
             if not games:
                 await update.message.reply_text("Нет последних игр для удаления")
                 return MAIN_MENU
@@ -119,10 +209,10 @@ async def delete_game_execute(update: Update, context: ContextTypes.DEFAULT_TYPE
             context.user_data['delete_options'] = {}
             
             response = "✏️ Выберите игру для удаления:\n\n"
-            for i, game in enumerate(games, 1):
-                response += f"{i}. {game.date.strftime('%d.%m.%Y')} - {game.winner}\n"
+            for i, (game_id, game_date, winner) in enumerate(games, 1):
+                response += f"{i}. {game_date.strftime('%d.%m.%Y')} - {winner}\n"
                 keyboard.append([str(i)])
-                context.user_data['delete_options'][str(i)] = game.id
+                context.user_data['delete_options'][str(i)] = game_id
                 
             keyboard.append(['Отмена'])
             
@@ -135,28 +225,27 @@ async def delete_game_execute(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Обработка ввода даты
         try:
             date_obj = datetime.strptime(text, '%d.%m.%Y').date()
-            games = session.query(PokerGame).filter(PokerGame.date == date_obj).all()
+            games = await run_db(_load_games_by_date, date_obj)
             
             if not games:
                 await update.message.reply_text("Игр на эту дату не найдено")
                 return DELETE_GAME
                 
             if len(games) == 1:
-                game = games[0]
-                session.delete(game)
-                session.commit()
+                game_id = games[0][0]
+                await run_db(_delete_game, game_id)
                 await update.message.reply_text(
-                    f"✅ Игра удалена:\n{game.date.strftime('%d.%m.%Y')}",
+                    f"✅ Игра удалена:\n{date_obj.strftime('%d.%m.%Y')}",
                     reply_markup=get_main_keyboard()
                 )
                 return MAIN_MENU
             else:
                 context.user_data['delete_options'] = {
-                    str(i): game.id for i, game in enumerate(games, 1)
+                    str(i): game_id for i, (game_id, _, _) in enumerate(games, 1)
                 }
                 response = "Найдено несколько игр:\n\n"
-                for i, game in enumerate(games, 1):
-                    response += f"{i}. {game.winner} (Банк: {game.bank})\n"
+                for i, (_, winner, bank) in enumerate(games, 1):
+                    response += f"{i}. {winner} (Банк: {bank})\n"
                     
                 await update.message.reply_text(
                     response,
@@ -176,6 +265,7 @@ async def delete_game_execute(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("Ошибка при обработке удаления")
         return MAIN_MENU
 
+@with_session
 async def delete_game_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         if update.message.text == 'Отмена':
@@ -191,19 +281,18 @@ async def delete_game_select(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return DELETE_GAME_SELECT
             
         game_id = context.user_data['delete_options'][choice]
-        game = session.query(PokerGame).get(game_id)
+        deleted = await run_db(_delete_game, game_id)
         
-        if not game:
+        if not deleted:
             await update.message.reply_text("Игра не найдена")
             return MAIN_MENU
             
-        session.delete(game)
-        session.commit()
+        game_date, winner = deleted
         
         await update.message.reply_text(
             f"✅ Игра успешно удалена:\n"
-            f"Дата: {game.date.strftime('%d.%m.%Y')}\n"
-            f"Победитель: {game.winner}",
+            f"Дата: {game_date.strftime('%d.%m.%Y')}\n"
+            f"Победитель: {winner}",
             reply_markup=get_main_keyboard()
         )
         return MAIN_MENU
@@ -213,14 +302,29 @@ async def delete_game_select(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("Ошибка при удалении")
         return MAIN_MENU
 
+GREETING_PHOTO = 'hi_pic.jpg'
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+async def _load_greeting_photo():
+    return InputFile(await run_blocking(_read_file, GREETING_PHOTO), filename=GREETING_PHOTO)
+
+@with_session
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    with open('hi_pic.jpg', 'rb') as photo:
-        await context.bot.send_photo(
-            chat_id=update.effective_chat.id,
-            photo=InputFile(photo),
-            caption="👋 Приветствую! Добро пожаловать в бот учета наших покерных игр.",
-            reply_markup=get_main_keyboard()
-        )
+    # Картинка загружается в Telegram один раз, дальше отправляется по file_id.
+    # Если файл заменят, изменится его версия и картинка загрузится заново.
+    stat = os.stat(GREETING_PHOTO)
+    await send_cached_photo(
+        context.bot,
+        update.effective_chat.id,
+        'greeting',
+        f'{stat.st_mtime_ns}-{stat.st_size}',
+        _load_greeting_photo,
+        caption="👋 Приветствую! Добро пожаловать в бот учета наших покерных игр.",
+        reply_markup=get_main_keyboard()
+    )
     return MAIN_MENU
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data.clear()
@@ -239,6 +343,7 @@ async def add_game_start(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
     return ADD_DATE
 
+@with_session
 async def add_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if await check_cancel(update, update.message.text):
         return MAIN_MENU
@@ -248,18 +353,19 @@ async def add_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         context.user_data['game_date'] = date_obj
         await update.message.reply_text(
             "✏️ Выберите город:",
-            reply_markup=get_cities_keyboard()
+            reply_markup=(await get_roster()).cities_keyboard
         )
         return ADD_CITY
     except ValueError:
         await update.message.reply_text("Неверный формат даты. Попробуйте еще раз (ДД.ММ.ГГГГ):")
         return ADD_DATE
 
+@with_session
 async def add_city(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if await check_cancel(update, update.message.text):
         return MAIN_MENU
     
-    if update.message.text not in CITIES:
+    if update.message.text not in (await get_roster()).city_set:
         await update.message.reply_text("Пожалуйста, выберите город из списка:")
         return ADD_CITY
     
@@ -270,6 +376,7 @@ async def add_city(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     )
     return ADD_PLAYERS_COUNT
 
+@with_session
 async def add_players_count(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if await check_cancel(update, update.message.text):
         return MAIN_MENU
@@ -283,33 +390,37 @@ async def add_players_count(update: Update, context: ContextTypes.DEFAULT_TYPE)
         context.user_data['players_count'] = players_count
         await update.message.reply_text(
             "✏️ Выберите победителя:",
-            reply_markup=get_players_keyboard()
+            reply_markup=(await get_roster()).players_keyboard
         )
         return ADD_WINNER
     except ValueError:
         await update.message.reply_text("✏️ Введите число:")
         return ADD_PLAYERS_COUNT
 
+@with_session
 async def add_winner(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if await check_cancel(update, update.message.text):
         return MAIN_MENU
     
-    if update.message.text not in PLAYERS:
+    roster = await get_roster()
+    if update.message.text not in roster.player_set:
         await update.message.reply_text("Пожалуйста, выберите игрока из списка:")
         return ADD_WINNER
     
     context.user_data['winner'] = update.message.text
     await update.message.reply_text(
         "✏️ Выберите занявшего 2 место:",
-        reply_markup=get_players_keyboard()
+        reply_markup=roster.players_keyboard
     )
     return ADD_SECOND_PLACE
 
+@with_session
 async def add_second_place(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if await check_cancel(update, update.message.text):
         return MAIN_MENU
     
-    if update.message.text not in PLAYERS:
+    roster = await get_roster()
+    if update.message.text not in roster.player_set:
         await update.message.reply_text("Пожалуйста, выберите игрока из списка:")
         return ADD_SECOND_PLACE
 
@@ -317,8 +428,7 @@ async def add_second_place(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
     # Проверяем, нужно ли запрашивать участников
     if context.user_data['game_date'] >= PARTICIPANTS_REQUEST_START_DATE:
-        available_players = [player for player in PLAYERS if player not in [context.user_data['winner'], context.user_data['second_place']]]
-        keyboard = ReplyKeyboardMarkup([[player] for player in available_players] + [['Отмена']], resize_keyboard=True)
+        keyboard = roster.available_keyboard([context.user_data['winner'], context.user_data['second_place']])
         await update.message.reply_text("✏️ Выберите участников игры (выберите из списка):", reply_markup=keyboard)
         return CONFIRM_PLAYERS
     else:
@@ -327,6 +437,7 @@ async def add_second_place(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return ADD_REBUYS
 
 
+@with_session
 async def add_players(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if await check_cancel(update, update.message.text):
         return MAIN_MENU
@@ -334,9 +445,8 @@ async def add_players(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     context.user_data['selected_players'] = []
 
     # Исключаем победителя и игрока, занявшего второе место, из списка доступных участников
-    available_players = [player for player in PLAYERS if player not in [context.user_data['winner'], context.user_data['second_place']]]
-
-    keyboard = ReplyKeyboardMarkup([[player] for player in available_players] + [['Отмена']], resize_keyboard=True)
+    roster = await get_roster()
+    keyboard = roster.available_keyboard([context.user_data['winner'], context.user_data['second_place']])
 
     await update.message.reply_text(
         "📌 Выберите участников игры (выберите из списка):",
@@ -345,10 +455,12 @@ async def add_players(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     return CONFIRM_PLAYERS
 
 
+@with_session
 async def confirm_players(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     selected_player = update.message.text
 
-    if selected_player not in PLAYERS:
+    roster = await get_roster()
+    if selected_player not in roster.player_set:
         await update.message.reply_text("Пожалуйста, выберите игрока из списка:")
         return CONFIRM_PLAYERS
 
@@ -368,9 +480,9 @@ async def confirm_players(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return ADD_REBUYS
 
-    available_players = [player for player in PLAYERS if player not in [context.user_data['winner'], context.user_data['second_place']] + context.user_data['selected_players']]
-
-    keyboard = ReplyKeyboardMarkup([[player] for player in available_players] + [['Отмена']], resize_keyboard=True)
+    keyboard = roster.available_keyboard(
+        [context.user_data['winner'], context.user_data['second_place']] + context.user_data['selected_players']
+    )
 
     await update.message.reply_text(
         f"Выбранные участники: {', '.join(context.user_data['selected_players'])}\n"
@@ -429,23 +541,45 @@ async def add_big_blind(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         await update.message.reply_text("Введите число:")
         return ADD_BIG_BLIND
 
-async def add_description(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    description = update.message.text if update.message.text != '-' else None
-
+def _save_game(session, game_data, description, player_names):
     # Создаем игру
     game = PokerGame(
-        date=context.user_data['game_date'],
-        city=context.user_data['city'],
-        players_count=context.user_data['players_count'],  # Сохраняем введенное количество игроков
-        winner=context.user_data['winner'],
-        second_place=context.user_data['second_place'],
-        rebuys=context.user_data['rebuys'],
-        bank=context.user_data['bank'],
-        buyin=context.user_data['buyin'],
-        big_blind=context.user_data['big_blind'],
+        date=game_data['game_date'],
+        city=game_data['city'],
+        players_count=game_data['players_count'],  # Сохраняем введенное количество игроков
+        winner=game_data['winner'],
+        second_place=game_data['second_place'],
+        rebuys=game_data['rebuys'],
+        bank=game_data['bank'],
+        buyin=game_data['buyin'],
+        big_blind=game_data['big_blind'],
         description=description
     )
 
+    # Добавляем игроков в игру
+    players = {}
+    for player_name in player_names:
+        player = session.query(Player).filter_by(name=player_name).first()
+        if not player:
+            player = Player(name=player_name)
+            session.add(player)
+        players[player_name] = player
+        # Один игрок может быть указан дважды (например, победителем и вторым местом)
+        if player not in game.players:
+            game.players.append(player)
+
+    # Призеры всегда есть среди участников
+    game.winner_player = players[game_data['winner']]
+    game.second_place_player = players[game_data['second_place']]
+
+    add_game(session, game)
+    session.commit()
+    return [p.name for p in game.players]
+
+@with_session
+async def add_description(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    description = update.message.text if update.message.text != '-' else None
+
     # Для игр после определенной даты добавляем участников
     if context.user_data['game_date'] >= PARTICIPANTS_REQUEST_START_DATE:
         selected_players = context.user_data.get('selected_players', [])
@@ -458,39 +592,25 @@ async def add_description(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 reply_markup=get_main_keyboard()
             )
             return MAIN_MENU
-
-        # Добавляем игроков в игру
-        for player_name in all_players:
-            player = session.query(Player).filter_by(name=player_name).first()
-            if not player:
-                player = Player(name=player_name)
-                session.add(player)
-            game.players.append(player)
     else:
         # Для старых игр просто добавляем победителя и второго места
-        for player_name in [context.user_data['winner'], context.user_data['second_place']]:
-            player = session.query(Player).filter_by(name=player_name).first()
-            if not player:
-                player = Player(name=player_name)
-                session.add(player)
-            game.players.append(player)
+        all_players = [context.user_data['winner'], context.user_data['second_place']]
 
-    session.add(game)
-    session.commit()
+    participants = await run_db(_save_game, context.user_data, description, all_players)
 
     # Формируем сообщение
     response = (
         "✅ Игра успешно добавлена!\n\n"
-        f"📅 Дата: {game.date.strftime('%d.%m.%Y')}\n"
-        f"🏙 Город: {game.city}\n"
-        f"👥 Игроков: {game.players_count}\n"
-        f"🏆 Победитель: {game.winner}\n"
-        f"🥈 2 место: {game.second_place}\n"
-        f"💰 Банк: {game.bank}\n\n"
+        f"📅 Дата: {context.user_data['game_date'].strftime('%d.%m.%Y')}\n"
+        f"🏙 Город: {context.user_data['city']}\n"
+        f"👥 Игроков: {context.user_data['players_count']}\n"
+        f"🏆 Победитель: {context.user_data['winner']}\n"
+        f"🥈 2 место: {context.user_data['second_place']}\n"
+        f"💰 Банк: {context.user_data['bank']}\n\n"
     )
 
     if context.user_data['game_date'] >= PARTICIPANTS_REQUEST_START_DATE:
-        response += f"Участники: {', '.join([p.name for p in game.players])}\n"
+        response += f"Участники: {', '.join(participants)}\n"
 
     await update.message.reply_text(
         response,
@@ -499,7 +619,7 @@ async def add_description(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return MAIN_MENU
 
 
-async def show_recent_games(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+def _recent_games_response(session):
     games = session.query(PokerGame).order_by(PokerGame.date.desc()).limit(5).all()
     
     if games:
@@ -513,6 +633,11 @@ async def show_recent_games(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
     else:
         response = "В базе пока нет игр."
+    return response
+
+@with_session
+async def show_recent_games(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    response = await cached_db(_recent_games_response)
     
     await update.message.reply_text(
         response,
@@ -520,80 +645,110 @@ async def show_recent_games(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
     return MAIN_MENU
 
+@with_session
 async def player_stats_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text(
         "✏️ Введите имя игрока для статистики или 'все' для полной статистики:",
-        reply_markup=ReplyKeyboardMarkup([['все']] + [[player] for player in PLAYERS] + [['Отмена']], resize_keyboard=True)
+        reply_markup=(await get_roster()).stats_keyboard
     )
     return PLAYER_STATS
 
+def _seasons_menu_response(session):
+    today = date.today()
+    seasons = list_seasons(session)
+    response = ""
+    for season in seasons:
+        response += f"🍀 {season.name}\n"
+        if season.end_date is not None and season.end_date < today:
+            # Итоги закрытого сезона уже не меняются
+            leaders = season_leaderboard(session, season)
+            if leaders:
+                response += f"🏆 Победитель: {leaders[0][0]} ({leaders[0][1]:.1f})\n"
+            if len(leaders) > 1:
+                response += f"🥈 Преследователь: {leaders[1][0]} ({leaders[1][1]:.1f})\n"
+            if not leaders:
+                response += "Игр в сезоне не было\n"
+        else:
+            response += "⏳ Сезон идет сейчас\n"
+        response += f"📅 {season_period(season)}\n\n"
+    if not seasons:
+        response = "Сезонов пока нет."
+    return response, [season.name for season in seasons]
+
+@with_session
 async def seasons_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    response, season_names = await run_db(_seasons_menu_response)
     await update.message.reply_text(
-        "🍀 Первый сезон: Лакерный\n\n"
-        "🏆 Победитель: Слава Харьков ()\n"
-        "🥈 Преследователь: Данила Бадецкий ()\n"
-        "📅 Сезон длился с начала гугл-таблицы до 31.05.2025",
-        reply_markup=get_seasons_keyboard()
+        response,
+        reply_markup=get_seasons_keyboard(season_names)
     )
     return SEASONS_MENU
 
-async def show_season_points(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    SEASON_START_DATE = datetime.strptime('01.06.2025', '%d.%m.%Y').date()
-    SEASON_END_DATE = datetime.strptime('30.11.2025', '%d.%m.%Y').date()
-    
-    # Получаем всех игроков
-    players = session.query(Player).all()
-    player_stats = []
-    
-    for player in players:
-        # Получаем игры сезона с участием игрока
-        season_games = session.query(PokerGame)\
-            .join(PokerGame.players)\
-            .filter(
-                Player.id == player.id,
-                PokerGame.date >= SEASON_START_DATE,
-                PokerGame.date <= SEASON_END_DATE
-            ).all()
-        
-        if not season_games:
-            continue
-            
-        # Считаем статистику
-        wins = len([g for g in season_games if g.winner == player.name])
-        seconds = len([g for g in season_games if g.second_place == player.name])
-        total_games = len(season_games)
-        
-        win_rate = (wins / total_games * 100) if total_games > 0 else 0
-        second_rate = (seconds / total_games * 100) if total_games > 0 else 0
-        
-        # Рассчитываем очки по формуле
-        points = win_rate + 0.33 * second_rate
-        player_stats.append((player.name, points, wins, seconds, total_games))
-    
-    # Сортируем по убыванию очков
-    player_stats.sort(key=lambda x: x[1], reverse=True)
+def _season_points_response(session, season_name=None):
+    if season_name is None:
+        season = current_season(session)
+    else:
+        season = session.query(Season).filter_by(name=season_name).first()
+    season_names = [season.name for season in list_seasons(session)]
+    if season is None:
+        return None, season_names
+
+    # Итоги сезона хранятся в season_results: одно чтение по ключу сезона
+    player_stats = season_leaderboard(session, season)
     
     # Формируем ответ (без Markdown разметки)
-    response = "🏆 Топ игроков текущего сезона:\n\n"
+    response = f"🏆 Топ игроков сезона {season.name} ({season_period(season)}):\n\n"
     response += "Рейтинг рассчитывается по формуле:\n"
-    response += "🃏 Очки = (Винрейт за 1 места) + 0.33 * (Винрейт за 2 места)\n"
+    if season.win_weight == 1:
+        response += f"🃏 Очки = (Винрейт за 1 места) + {season.second_weight:g} * (Винрейт за 2 места)\n"
+    else:
+        response += (f"🃏 Очки = {season.win_weight:g} * (Винрейт за 1 места) + "
+                     f"{season.second_weight:g} * (Винрейт за 2 места)\n")
     response += "📊 Статистика выводится в виде: (Очки / Победы в сезоне / Вторые места в сезоне / Количество игр)\n\n"
     
     for i, (name, points, wins, seconds, total) in enumerate(player_stats, 1):
-        win_rate = (wins / total * 100) if total > 0 else 0
-        second_rate = (seconds / total * 100) if total > 0 else 0
         response += f"🔻 {name}: {points:.1f} / {wins} / {seconds} / {total}\n\n"
     
     if not player_stats:
-        response = "В текущем сезоне еще не было игр."
+        response = f"В сезоне {season.name} еще не было игр."
+    return response, season_names
+
+@with_session
+async def show_season_points(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    # 'Очки сезона' — текущий сезон, название сезона — его таблица
+    season_name = None if update.message.text == 'Очки сезона' else update.message.text
+    response, season_names = await cached_db(_season_points_response, season_name)
+    if response is None:
+        response = "Выберите сезон из списка."
     
     await update.message.reply_text(
         response,
-        reply_markup=get_seasons_keyboard(),
+        reply_markup=get_seasons_keyboard(season_names),
         parse_mode=None  
     )
     return SEASONS_MENU
 
+def _ratings_response(session):
+    season_names = [season.name for season in list_seasons(session)]
+    leaderboard = rating_leaderboard(session)
+    if not leaderboard:
+        return "Рейтинг пока не рассчитан: в базе нет игр.", season_names
+    response = f"📈 Рейтинг игроков (Эло, начальный рейтинг {INITIAL_RATING:.0f}):\n"
+    response += "Учитываются все игры: место, число игроков и рейтинг соперников\n\n"
+    for i, (name, rating, games) in enumerate(leaderboard, 1):
+        response += f"{i}. {name}: {rating:.0f} ({games} игр)\n"
+    return response, season_names
+
+@with_session
+async def show_ratings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    response, season_names = await run_db(_ratings_response)
+    await update.message.reply_text(
+        response,
+        reply_markup=get_seasons_keyboard(season_names)
+    )
+    return SEASONS_MENU
+
+@with_session
 async def show_player_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     player_name = update.message.text
 
@@ -603,30 +758,56 @@ async def show_player_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if player_name.lower() == 'все':
         return await show_all_stats(update, context)
 
-    # Определяем даты начала и конца сезона
-    SEASON_START_DATE = datetime.strptime('01.06.2025', '%d.%m.%Y').date()
-    SEASON_END_DATE = datetime.strptime('30.11.2025', '%d.%m.%Y').date()
+    response = await cached_db(_player_stats_response, player_name)
+
+    await update.message.reply_text(
+        response,
+        reply_markup=get_main_keyboard(),
+        parse_mode='Markdown'
+    )
+    return MAIN_MENU
+
+def _player_stats_response(session, player_name):
+    # Статистика сезона — за текущий сезон из таблицы seasons
+    season = current_season(session)
+    season_start = season.start_date if season else None
+    season_end = season.end_date if season else None
+
+    player_id = session.query(Player.id).filter(Player.name == player_name).scalar()
+    if player_id is None:
+        return f"Игрока {player_name} не найдено в базе данных."
 
-    # Получаем все игры игрока
-    games_participated = session.query(PokerGame).join(PokerGame.players).filter(
-        Player.name == player_name
-    ).order_by(PokerGame.date.desc()).all()
+    # Счетчики считаются по колоночному снимку игр, без загрузки ORM-объектов
+    columns = game_snapshot.refresh(session)
+    games_participated = columns.player_games(player_id)
+    if not len(games_participated):
+        return f"Игрока {player_name} не найдено в базе данных."
 
     # Статистика за все время
-    wins_all = [game for game in games_participated if game.winner == player_name]
-    seconds_all = [game for game in games_participated if game.second_place == player_name]
-    total_bank_won_all = sum(game.bank for game in wins_all)
+    wins_all = games_participated[columns.winners[games_participated] == player_id]
+    seconds_all = games_participated[columns.seconds[games_participated] == player_id]
+    total_bank_won_all = float(columns.banks[wins_all].sum())
 
     # Статистика за сезон
-    season_games = [game for game in games_participated if SEASON_START_DATE <= game.date <= SEASON_END_DATE]
-    season_wins = [game for game in season_games if game.winner == player_name]
-    season_seconds = [game for game in season_games if game.second_place == player_name]
+    season_games = games_participated[columns.date_mask(season_start, season_end)[games_participated]]
+    season_wins = season_games[columns.winners[season_games] == player_id]
+    season_seconds = season_games[columns.seconds[season_games] == player_id]
     season_top2 = len(season_wins) + len(season_seconds)
-    season_bank = sum(game.bank for game in season_wins)
+    season_bank = float(columns.banks[season_wins].sum())
 
     # Рассчитываем проценты для сезона
-    season_win_rate_top2 = (season_top2 / len(season_games) * 100) if season_games else 0
-    season_win_rate = (len(season_wins) / len(season_games) * 100) if season_games else 0
+    season_win_rate_top2 = (season_top2 / len(season_games) * 100) if len(season_games) else 0
+    season_win_rate = (len(season_wins) / len(season_games) * 100) if len(season_games) else 0
+
+    # Подробности нужны только для трех последних побед и вторых мест
+    latest_wins = columns.ids[columns.latest(wins_all, 3)].tolist()
+    latest_seconds = columns.ids[columns.latest(seconds_all, 3)].tolist()
+    games_by_id = {
+        game.id: game for game in session.query(PokerGame).filter(PokerGame.id.in_(latest_wins + latest_seconds))
+    }
+
+    rating = player_rating(session, player_id)
+    rating_text = f"{rating[0]:.0f} ({rating[1]} игр)" if rating else "нет рейтинговых игр"
 
     # Формируем ответ
     response = (
@@ -634,8 +815,9 @@ async def show_player_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
         "ℹ️ Статистика за все время:\n"
         f"🏆 Побед: {len(wins_all)}\n"
         f"🥈 Вторых мест: {len(seconds_all)}\n"
-        f"💰 Общий банк, который был выигран: {total_bank_won_all}\n\n"
-        f"ℹ️ Статистика сезона ({SEASON_START_DATE.strftime('%d.%m.%Y')}-{SEASON_END_DATE.strftime('%d.%m.%Y')}):\n"
+        f"💰 Общий банк, который был выигран: {total_bank_won_all}\n"
+        f"📈 Рейтинг: {rating_text}\n\n"
+        f"ℹ️ Статистика сезона ({season_period(season) if season else 'все время'}):\n"
         f"🏆 Побед в сезоне: {len(season_wins)}\n"
         f"🥈 Вторых мест в сезоне: {len(season_seconds)}\n"
         f" Всего игр в сезоне: {len(season_games)}\n"
@@ -646,64 +828,44 @@ async def show_player_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
 
     # Добавляем последние победы
-    if wins_all:
+    if latest_wins:
         response += "🏆 Последние победы:\n"
-        for i, game in enumerate(wins_all[:3], 1):
+        for i, game in enumerate((games_by_id[game_id] for game_id in latest_wins), 1):
             response += (
                 f"{i}. {game.date.strftime('%d.%m.%Y')} - {game.city} (Банк: {game.bank})\n"
             )
         response += "\n"
 
     # Добавляем последние победы в сезоне
-    if seconds_all:
+    if latest_seconds:
         response += "🥈 Последние вторые места:\n"
-        for i, game in enumerate(seconds_all[:3], 1):
+        for i, game in enumerate((games_by_id[game_id] for game_id in latest_seconds), 1):
             response += (
                 f"{i}. {game.date.strftime('%d.%m.%Y')} - {game.city}\n"
                 f"   Победитель: {game.winner}\n"
             )
+    return response
 
-    if not games_participated:
-        response = f"Игрока {player_name} не найдено в базе данных."
-
-    await update.message.reply_text(
-        response,
-        reply_markup=get_main_keyboard(),
-        parse_mode='Markdown'
-    )
-    return MAIN_MENU
-
-async def show_all_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    all_games = session.query(PokerGame).all()
-
-    img_buffer = generate_pie_chart_stats()
+def _all_stats_response(session):
+    # Статистика берется из накопленной таблицы player_stats, без обхода всех игр
+    rows = session.query(PlayerStats, Player.name)\
+        .join(Player, Player.id == PlayerStats.player_id)\
+        .order_by(PlayerStats.player_id).all()
 
     stats = {}
-    for game in all_games:
-        for player in game.players:
-            if player.name not in stats:
-                stats[player.name] = {'wins_all': 0, 'seconds_all': 0, 'total_bank_won_all': 0, 'wins': 0, 'seconds': 0, 'total_games': 0, 'total_bank_won': 0}
-
-            # Считаем победы, вторые места и банк по всем играм
-            if game.winner == player.name:
-                stats[player.name]['wins_all'] += 1
-                stats[player.name]['total_bank_won_all'] += game.bank
-            if game.second_place == player.name:
-                stats[player.name]['seconds_all'] += 1
-
-            # Считаем попадания в топ 2 и винрейты только с указанной даты
-            if game.date >= PARTICIPANTS_REQUEST_START_DATE:
-                stats[player.name]['total_games'] += 1
-
-                if game.winner == player.name:
-                    stats[player.name]['wins'] += 1
-                    stats[player.name]['total_bank_won'] += game.bank
-                elif game.second_place == player.name:
-                    stats[player.name]['seconds'] += 1
+    for row, name in rows:
+        stats[name] = {
+            'wins_all': row.wins_all,
+            'seconds_all': row.seconds_all,
+            'total_bank_won_all': row.bank_won_all,
+            'wins': row.wins_recent,
+            'seconds': row.seconds_recent,
+            'total_games': row.games_recent,
+            'total_bank_won': row.bank_won_recent,
+        }
 
     if not stats:
-        await update.message.reply_text("В базе нет данных об играх.")
-        return MAIN_MENU
+        return None
 
     response = "📊 Общая статистика всех игроков:\n\n"
     for player, data in sorted(stats.items(), key=lambda x: (x[1]['wins'], x[1]['seconds']), reverse=True):
@@ -724,13 +886,42 @@ async def show_all_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
     
     response += ("ℹ️ Для просмотра подробной статистки, перейдите в статистику конкретного игрока.\n\n")
+    return response
+
+def _pie_chart_source(session):
+    generation = get_data_generation(session)
+    png = chart_cache.get('pie', generation)
+    if png is not None:
+        return generation, png, None
+    return generation, None, pie_chart_spec(session)
+
+async def get_pie_chart_png():
+    # Диаграмма перерисовывается только после изменения игр
+    generation, png, spec = await run_db(_pie_chart_source)
+    if png is None and spec is not None:
+        png = await chart_service.render(spec)
+        await run_blocking(chart_cache.put, 'pie', generation, png)
+    return png
+
+@with_session
+async def show_all_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    response = await cached_db(_all_stats_response)
 
-    await context.bot.send_photo(
-            chat_id=update.effective_chat.id,
-            photo=img_buffer,
-            caption="📌 Диаграмма распределения всех выигранных банков между игроками",
-            reply_markup=get_main_keyboard()
-        )
+    if not response:
+        await update.message.reply_text("В базе нет данных об играх.")
+        return MAIN_MENU
+
+    # Диаграмма текущего поколения данных, уже загруженная в Telegram, отправляется по file_id
+    generation = await get_data_generation_cached()
+    await send_cached_photo(
+        context.bot,
+        update.effective_chat.id,
+        'chart:pie',
+        generation,
+        get_pie_chart_png,
+        caption="📌 Диаграмма распределения всех выигранных банков между игроками",
+        reply_markup=get_main_keyboard()
+    )
 
     await update.message.reply_text(
         response,
@@ -741,34 +932,31 @@ async def show_all_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def search_game_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text(
-        "📌 Введите дату игры (ДД.ММ.ГГГГ) или город для поиска:",
+        "📌 Введите дату игры (ДД.ММ.ГГГГ), город, имя игрока или слово из описания:",
         reply_markup=ReplyKeyboardMarkup([['Отмена']], resize_keyboard=True)
     )
     return SEARCH_GAME
 
-async def search_game(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    search_term = update.message.text
-    
+def _search_game_responses(session, search_term):
     try:
         search_date = datetime.strptime(search_term, '%d.%m.%Y').date()
-        games = session.query(PokerGame).filter(PokerGame.date == search_date).all()
+        games = session.query(PokerGame)\
+            .options(selectinload(PokerGame.players))\
+            .filter(PokerGame.date == search_date).all()
     except ValueError:
-        games = session.query(PokerGame).filter(PokerGame.city.ilike(f"%{search_term}%")).all()
-    
-    if not games:
-        await update.message.reply_text(
-            "ℹ️ Игр не найдено.",
-            reply_markup=get_main_keyboard()
-        )
-        return MAIN_MENU
+        # Полнотекстовый поиск по городу, описанию, призерам и участникам
+        game_ids = search_games(session, search_term, config.SEARCH_RESULT_LIMIT)
+        games_by_id = {
+            game.id: game for game in session.query(PokerGame)
+            .options(selectinload(PokerGame.players))
+            .filter(PokerGame.id.in_(game_ids))
+        }
+        games = [games_by_id[game_id] for game_id in game_ids if game_id in games_by_id]
     
+    responses = []
     for game in games:
-        # Получаем участников игры через связь many-to-many
-        participants = session.query(Player).\
-            join(game_players_association).\
-            join(PokerGame).\
-            filter(PokerGame.id == game.id).\
-            all()
+        # Участники всех найденных игр загружены одним запросом (selectinload)
+        participants = game.players
         
         # Формируем информацию об игре
         response = (
@@ -789,30 +977,180 @@ async def search_game(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
                 response += "\n👤 *Участники:*\n"
                 for player in participants:
                     # Добавляем эмодзи для победителя и второго места
-                    if player.name == game.winner:
+                    if player.id == game.winner_id:
                         response += f"👑 {player.name}\n"
-                    elif player.name == game.second_place:
+                    elif player.id == game.second_place_id:
                         response += f"🥈 {player.name}\n"
                     else:
                         response += f"👤 {player.name}\n"
         
-        # Добавляем описание, если оно есть
+        # Добавляем описание, если оно есть. Его вводит пользователь, поэтому символы
+        # разметки экранируются: иначе непарная * испортила бы всю страницу поиска
         if game.description:
-            response += f"\n📝 Описание: {game.description}\n"
+            response += f"\n📝 Описание: {escape_markdown(game.description)}\n"
         
-        # Отправляем сообщение для каждой игры
+        responses.append(response)
+    return responses
+
+def _split_lines(block, limit):
+    # Блок длиннее сообщения делится по строкам: разметка (*жирный*) не переходит
+    # через перевод строки, поэтому так ее не разорвать. Строка длиннее limit (длинное
+    # описание) режется по пробелу и так, чтобы не отделить \ от экранированного символа.
+    for line in block.split('\n'):
+        while len(line) > limit:
+            cut = line.rfind(' ', 0, limit) + 1 or limit
+            while cut > 1 and line[cut - 1] == '\\':
+                cut -= 1
+            yield line[:cut]
+            line = line[cut:]
+        yield line
+
+def _pack_messages(blocks, limit=MessageLimit.MAX_TEXT_LENGTH):
+    # Склеивает блоки в как можно меньшее число сообщений не длиннее limit.
+    # Блок, который не помещается в одно сообщение, продолжается в следующем с границы строки.
+    pages = []
+    current = ''
+    for block in blocks:
+        parts = [block] if len(block) <= limit else list(_split_lines(block, limit))
+        for part in parts:
+            if current and len(current) + len('\n') + len(part) > limit:
+                pages.append(current)
+                current = ''
+            current = f"{current}\n{part}" if current else part
+    if current:
+        pages.append(current)
+    return pages
+
+def get_search_more_keyboard():
+    return ReplyKeyboardMarkup([['Ещё'], ['Вернуться в главное меню']], resize_keyboard=True)
+
+async def _send_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    pages = context.user_data.get('search_pages', [])
+    page = pages.pop(0)
+    if pages:
+        await update.message.reply_text(page, reply_markup=get_search_more_keyboard(), parse_mode='Markdown')
+        return SEARCH_GAME
+
+    context.user_data.pop('search_pages', None)
+    await update.message.reply_text(page, reply_markup=get_main_keyboard(), parse_mode='Markdown')
+    return MAIN_MENU
+
+@with_session
+async def search_game(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    search_term = update.message.text
+    
+    responses = await run_db(_search_game_responses, search_term)
+    
+    if not responses:
         await update.message.reply_text(
-            response,
-            reply_markup=get_main_keyboard(),
-            parse_mode='Markdown'
+            "ℹ️ Игр не найдено.",
+            reply_markup=get_main_keyboard()
         )
+        return MAIN_MENU
     
-    return MAIN_MENU
+    # Найденные игры отправляются страницами, остальные по кнопке 'Ещё'
+    context.user_data['search_pages'] = _pack_messages(responses)
+    return await _send_search_page(update, context)
+
+async def search_game_more(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    if not context.user_data.get('search_pages'):
+        return await search_game(update, context)
+    return await _send_search_page(update, context)
+
+async def on_startup(application: Application) -> None:
+    chart_service.start()
+    await metrics_server.start()
+
+async def on_shutdown(application: Application) -> None:
+    chart_service.shutdown()
+    await metrics_server.stop()
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # /export — CSV, /export parquet — Parquet. Файл пишется в отдельном потоке,
+    # поэтому долгая выгрузка не задерживает ответы в других чатах.
+    export_format = context.args[0].lower() if context.args else 'csv'
+    if export_format not in ('csv', 'parquet'):
+        await update.message.reply_text("Формат выгрузки: /export или /export parquet")
+        return
+
+    await context.bot.send_chat_action(update.effective_chat.id, ChatAction.UPLOAD_DOCUMENT)
+    filename = f"poker_games_{datetime.now().strftime('%Y%m%d')}.{export_format}"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, filename)
+        try:
+            count = await run_blocking(export_games, engine, path, export_format)
+        except RuntimeError as e:
+            # Например, для Parquet не установлен pyarrow
+            await update.message.reply_text(str(e))
+            return
+        except Exception as e:
+            logger.error(f"Error while exporting games: {e}")
+            await update.message.reply_text("Не удалось выгрузить игры.")
+            return
+        with open(path, 'rb') as document:
+            await update.message.reply_document(
+                document, filename=filename, caption=f"📤 Выгружено игр: {count}"
+            )
 
-def main() -> None:
-    application = Application.builder().token("token").build()
+async def maintenance_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Обслуживание базы в отдельном потоке; бот в это время продолжает отвечать
+    try:
+        report = await run_blocking(run_maintenance, engine)
+    except Exception as e:
+        logger.error(f"Database maintenance failed: {e}")
+        return
+    if report.ok:
+        logger.info(f"Database maintenance finished in {report.describe()}")
+    else:
+        logger.error(
+            f"Database maintenance found problems: {report.integrity_errors[:10]}, "
+            f"foreign key violations: {report.foreign_key_errors}; {report.describe()}"
+        )
+
+async def backup_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Копия снимается в потоке базы, обработчики в это время продолжают читать и писать
+    try:
+        result = await run_blocking(backup_database, engine)
+    except Exception as e:
+        logger.error(f"Database backup failed: {e}")
+        return
+    logger.info(
+        f"Database backup {result.path}: {result.size} bytes in {result.seconds:.2f} s, "
+        f"removed {len(result.removed)} old backups"
+    )
+
+def schedule_maintenance(application: Application) -> None:
+    if not config.MAINTENANCE_TIME and not config.BACKUP_DIR:
+        return
+    if application.job_queue is None:
+        logger.warning("JobQueue is not available (install APScheduler), database maintenance and backups are disabled")
+        return
+    if config.MAINTENANCE_TIME:
+        run_at = datetime.strptime(config.MAINTENANCE_TIME, '%H:%M').time()
+        application.job_queue.run_daily(maintenance_job, time=run_at, name='maintenance')
+    if config.BACKUP_DIR:
+        # Первая копия через минуту после запуска, дальше — каждые BACKUP_INTERVAL_HOURS
+        application.job_queue.run_repeating(
+            backup_job, interval=config.BACKUP_INTERVAL_HOURS * 3600, first=60, name='backup'
+        )
+
+def build_application(builder=None) -> Application:
+    migrate(engine)
+    # Запросы к Bot API замеряются; размер пула соединений как у стандартного запроса
+    builder = builder or Application.builder().token(config.BOT_TOKEN)\
+        .request(InstrumentedRequest(HTTPXRequest(connection_pool_size=256)))
+    application = (
+        builder
+        .concurrent_updates(PerChatUpdateProcessor(config.MAX_CONCURRENT_UPDATES))
+        .persistence(SQLitePersistence(engine, update_interval=config.PERSISTENCE_INTERVAL))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     
     conv_handler = ConversationHandler(
+        name='main',
+        persistent=True,
         entry_points=[CommandHandler('start', start)],
         states={
             MAIN_MENU: [
@@ -868,6 +1206,8 @@ def main() -> None:
                 MessageHandler(filters.Regex('^Отмена$'), cancel),
             ],
             SEARCH_GAME: [
+                MessageHandler(filters.Regex('^Ещё$'), search_game_more),
+                MessageHandler(filters.Regex('^Вернуться в главное меню$'), cancel),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, search_game),
                 MessageHandler(filters.Regex('^Отмена$'), cancel),
             ],
@@ -884,8 +1224,9 @@ def main() -> None:
                 MessageHandler(filters.Regex('^Отмена$'), cancel),
             ],
             SEASONS_MENU: [
-                MessageHandler(filters.Regex('^Очки сезона$'), show_season_points),
                 MessageHandler(filters.Regex('^Вернуться в главное меню$'), cancel),
+                MessageHandler(filters.Regex('^Рейтинг$'), show_ratings),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, show_season_points),
             ],
         },
         fallbacks=[
@@ -895,8 +1236,15 @@ def main() -> None:
         ],
     )
     
+    instrument_conversation(conv_handler, STATE_NAMES)
     application.add_handler(conv_handler)
-    application.run_polling()
+    # Выгрузка доступна из любого шага диалога и не меняет его состояние
+    application.add_handler(CommandHandler('export', export_command))
+    schedule_maintenance(application)
+    return application
+
+def main() -> None:
+    run_application(build_application())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class ChartCache:
+    # Кэш готовых PNG-диаграмм по ключу (имя диаграммы, поколение данных).
+    # Для каждой диаграммы хранится только последнее поколение: старые уже не понадобятся.
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._memory = {}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name, generation):
+        return os.path.join(self.directory, f'{name}_{generation}.png')
+
+    def get(self, name, generation):
+        with self._lock:
+            cached = self._memory.get(name)
+            if cached and cached[0] == generation:
+                return cached[1]
+
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(name, generation), 'rb') as f:
+                png = f.read()
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            self._memory[name] = (generation, png)
+        return png
+
+    def put(self, name, generation, png):
+        with self._lock:
+            self._memory[name] = (generation, png)
+
+        if not self.directory:
+            return
+        path = self._path(name, generation)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+
+        # Удаляем файлы прошлых поколений
+        for filename in os.listdir(self.directory):
+            if filename.startswith(f'{name}_') and filename.endswith('.png') \
+                    and filename != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except FileNotFoundError:
+                    pass
+
+
+class ResultCache:
+    # LRU-кэш готовых ответов по ключу (обработчик, аргументы, поколение данных).
+    # Старые поколения не удаляются явно: к ним больше не обращаются, и они вытесняются первыми.
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        # (True, значение) или (False, None); None — допустимое значение ответа
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,69 @@
+import io
+
+# Тяжелая часть диаграмм: импортируется только при первой отрисовке (см. charts.render_chart).
+# Бэкенд Agg выбирается до импорта pyplot, интерактивный бэкенд боту не нужен.
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+
+def generate_pie_chart_stats(spec):
+    players = spec['labels']
+    banks = spec['values']
+    total = sum(banks)
+    
+    plt.figure(figsize=(10, 8))
+    
+    explode = [0.1 if bank == max(banks) else 0 for bank in banks]
+    
+    # Красивые цвета
+    colors = plt.cm.Pastel1(range(len(players)))
+    
+    wedges, texts, autotexts = plt.pie(
+        banks,
+        labels=players,
+        autopct=lambda p: f'{p:.1f}%',
+        startangle=140,
+        colors=colors,
+        explode=explode,
+        shadow=True,
+        textprops={'fontsize': 12}
+    )
+    
+    for autotext in autotexts:
+        autotext.set_color('black')
+        autotext.set_fontsize(12)
+    
+    plt.title('Распределение выигранных банков между игроками', pad=20)
+    
+    legend_labels = [f'{p} - {b:.2f}' for p, b in zip(players, banks)]
+    plt.legend(
+        wedges,
+        legend_labels,
+        title="Игроки и их выигрыш за все время",
+        loc="center left",
+        bbox_to_anchor=(1, 0, 0.5, 1),
+        fontsize=10
+    )
+    plt.setp(autotexts, size=12, weight="bold")  
+
+    centre_circle = plt.Circle((0,0), 0.50, fc='white')
+    fig = plt.gcf()
+    fig.gca().add_artist(centre_circle)
+    plt.text(0, 0, f"Всего разыграно:\n{total:.2f}", ha='center', va='center', fontsize=15)
+    
+    plt.tight_layout()
+    
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+    plt.close()
+    
+    return buf.getvalue()
+
+# Типы диаграмм: spec['type'] -> функция, возвращающая PNG
+RENDERERS = {
+    'pie': generate_pie_chart_stats,
+}
+
+def render_chart(spec):
+    return RENDERERS[spec['type']](spec)
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+from cache import ChartCache
+from metrics import observe_chart
+
+logger = logging.getLogger(__name__)
+
+
+def render_chart(spec):
+    # matplotlib загружается при первой отрисовке, а не при запуске бота
+    from chart_rendering import render_chart as render
+    return render(spec)
+
+def _warm_up_worker():
+    # Первая отрисовка в процессе загружает шрифты и бэкенд, делаем ее до первого запроса
+    render_chart({'type': 'pie', 'labels': ['-'], 'values': [1.0]})
+
+
+class ChartService:
+    # Отрисовка диаграмм в отдельных процессах: matplotlib нагружает CPU и держит GIL,
+    # поэтому внутри процесса бота она тормозила бы все остальные чаты.
+
+    def __init__(self, workers=config.CHART_WORKERS):
+        self.workers = workers
+        self._pool = None
+        # Без пула процессов (скрипты, отладка) рисуем в одном потоке: pyplot не потокобезопасен
+        self._fallback = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chart')
+
+    def _create_pool(self):
+        # Не fork: в процессе бота уже работают потоки базы и открыты соединения SQLite,
+        # копировать их в дочерний процесс небезопасно. Процессы порождает forkserver,
+        # в котором заранее загружен только chart_rendering (matplotlib).
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['chart_rendering'])
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_warm_up_worker)
+        # Процессы создаются по требованию, поэтому запускаем их все сразу
+        for _ in range(self.workers):
+            pool.submit(int)
+        return pool
+
+    def start(self):
+        if self._pool is not None or self.workers <= 0:
+            return
+        self._pool = self._create_pool()
+        logger.info(f"Chart service started with {self.workers} workers")
+
+    def _restart(self, broken):
+        # Пул, в котором упал процесс, больше не принимает задачи: заменяем его новым.
+        # Несколько отрисовок могут заметить это одновременно, пул пересоздается один раз.
+        if self._pool is broken:
+            logger.warning("Chart worker pool is broken, restarting it")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._create_pool()
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def render(self, spec):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        executor = self._pool or self._fallback
+        try:
+            try:
+                return await loop.run_in_executor(executor, render_chart, spec)
+            except BrokenProcessPool:
+                return await loop.run_in_executor(self._restart(executor), render_chart, spec)
+        finally:
+            observe_chart(spec['type'], time.perf_counter() - started)
+
+chart_service = ChartService()
+chart_cache = ChartCache(config.CHART_CACHE_DIR)
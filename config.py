@@ -0,0 +1,73 @@
+import os
+
+# Настройки бота. Любое значение можно переопределить переменной окружения.
+
+BOT_TOKEN = os.getenv('POKERBOT_TOKEN', 'token')
+
+# Получение обновлений: 'polling' (по умолчанию) или 'webhook'
+BOT_MODE = os.getenv('POKERBOT_MODE', 'polling')
+# Адрес и порт встроенного HTTP-сервера. По умолчанию он доступен только локально,
+# а снаружи запросы принимает прокси, который завершает TLS (например, nginx).
+WEBHOOK_LISTEN = os.getenv('POKERBOT_WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('POKERBOT_WEBHOOK_PORT', '8080'))
+# Публичный https-адрес прокси, без пути
+WEBHOOK_URL = os.getenv('POKERBOT_WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('POKERBOT_WEBHOOK_PATH', 'telegram')
+# Секрет, который Telegram передает в каждом запросе. Пустой — генерируется при запуске.
+WEBHOOK_SECRET_TOKEN = os.getenv('POKERBOT_WEBHOOK_SECRET_TOKEN', '')
+# Сколько обновлений из разных чатов обрабатывается одновременно
+MAX_CONCURRENT_UPDATES = int(os.getenv('POKERBOT_MAX_CONCURRENT_UPDATES', '16'))
+
+# База данных
+DB_URL = os.getenv('POKERBOT_DB_URL', 'sqlite:///poker_games.db')
+# Сколько соединений держит пул и сколько можно открыть сверх него под нагрузкой
+DB_POOL_SIZE = int(os.getenv('POKERBOT_DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('POKERBOT_DB_MAX_OVERFLOW', '5'))
+# Сколько секунд обработчик ждет свободное соединение, прежде чем упасть с ошибкой
+DB_POOL_TIMEOUT = float(os.getenv('POKERBOT_DB_POOL_TIMEOUT', '10'))
+
+# Каталог для кэша диаграмм на диске, чтобы они переживали перезапуск.
+# Пустое значение — кэш только в памяти.
+CHART_CACHE_DIR = os.getenv('POKERBOT_CHART_CACHE_DIR') or None
+
+# Сколько процессов рисуют диаграммы. 0 — рисовать в процессе бота.
+CHART_WORKERS = int(os.getenv('POKERBOT_CHART_WORKERS', '2'))
+
+# Сколько игр находить при поиске по тексту (выдаются страницами)
+SEARCH_RESULT_LIMIT = int(os.getenv('POKERBOT_SEARCH_RESULT_LIMIT', '50'))
+
+# Как часто (в секундах) незаконченные диалоги сохраняются в базу
+PERSISTENCE_INTERVAL = float(os.getenv('POKERBOT_PERSISTENCE_INTERVAL', '5'))
+
+# Метрики в формате Prometheus: адрес и порт (0 — не запускать)
+METRICS_LISTEN = os.getenv('POKERBOT_METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('POKERBOT_METRICS_PORT', '9464'))
+# Обновления дольше этого (в секундах) попадают в журнал с разбивкой времени
+SLOW_UPDATE_SECONDS = float(os.getenv('POKERBOT_SLOW_UPDATE_SECONDS', '1'))
+
+# Как часто (в секундах) бот сверяет состав игроков и список городов с базой
+ROSTER_REFRESH_SECONDS = float(os.getenv('POKERBOT_ROSTER_REFRESH_SECONDS', '10'))
+
+# Сколько готовых ответов меню (последние игры, статистика, очки сезона) держать в памяти, 0 — не кэшировать
+RESPONSE_CACHE_SIZE = int(os.getenv('POKERBOT_RESPONSE_CACHE_SIZE', '256'))
+# Как часто (в секундах) бот сверяет поколение данных с базой, чтобы увидеть изменения
+# из командной строки (импорт, сезоны, игроки); свои изменения бот видит сразу
+GENERATION_REFRESH_SECONDS = float(os.getenv('POKERBOT_GENERATION_REFRESH_SECONDS', '5'))
+
+# Ежедневное обслуживание базы (maintenance.py): время ЧЧ:ММ по UTC, пустое значение — не запускать
+MAINTENANCE_TIME = os.getenv('POKERBOT_MAINTENANCE_TIME', '04:00')
+
+# Настройки SQLite на каждом соединении (PRAGMA). Пустое значение — оставить как есть.
+DB_JOURNAL_MODE = os.getenv('POKERBOT_DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.getenv('POKERBOT_DB_SYNCHRONOUS', 'NORMAL')
+# Размер кэша страниц: отрицательное значение — в КиБ
+DB_CACHE_SIZE = os.getenv('POKERBOT_DB_CACHE_SIZE', '-20000')
+# Сколько байт файла базы читать через mmap
+DB_MMAP_SIZE = os.getenv('POKERBOT_DB_MMAP_SIZE', '268435456')
+# Сколько миллисекунд ждать, пока другое соединение освободит блокировку
+DB_BUSY_TIMEOUT = os.getenv('POKERBOT_DB_BUSY_TIMEOUT', '5000')
+
+# Резервные копии базы: каталог (пустой — не делать), интервал в часах и сколько копий хранить
+BACKUP_DIR = os.getenv('POKERBOT_BACKUP_DIR', '')
+BACKUP_INTERVAL_HOURS = float(os.getenv('POKERBOT_BACKUP_INTERVAL_HOURS', '6'))
+BACKUP_KEEP = int(os.getenv('POKERBOT_BACKUP_KEEP', '8'))
@@ -1,18 +1,30 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Float, ForeignKey, Table, func
+from sqlalchemy import create_engine, event, cast, Boolean, Column, Integer, String, Date, Float, ForeignKey, Index, LargeBinary, Table, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, sessionmaker, relationship
 from datetime import date
-import matplotlib.pyplot as plt
-import io
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+import contextvars
+import asyncio
+import functools
+import logging
+import threading
+import time
+
+import config
+from storage import configure_sqlite
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
-# Таблица для связи между играми и участниками
+# Таблица для связи между играми и участниками, связи удаляются вместе с игрой
 game_players_association = Table(
     'game_players_association',
     Base.metadata,
-    Column('game_id', Integer, ForeignKey('poker_games.id')),
-    Column('player_id', Integer, ForeignKey('players.id'))
+    Column('game_id', Integer, ForeignKey('poker_games.id', ondelete='CASCADE'), primary_key=True),
+    Column('player_id', Integer, ForeignKey('players.id'), primary_key=True, index=True)
 )
 
 class Player(Base):
@@ -20,16 +32,29 @@ class Player(Base):
 
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True)
+    # Игрок в текущем составе: его можно выбрать на клавиатурах бота
+    in_roster = Column(Boolean, nullable=False, default=False, server_default='0')
+
+# Города, которые предлагаются при добавлении игры
+class City(Base):
+    __tablename__ = 'cities'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
 
 class PokerGame(Base):
     __tablename__ = 'poker_games'
 
     id = Column(Integer, primary_key=True)
-    date = Column(Date, default=date.today())
-    city = Column(String)
+    date = Column(Date, default=date.today(), index=True)
+    city = Column(String, index=True)
     players_count = Column(Integer)
-    winner = Column(String)
-    second_place = Column(String)
+    # Призеры — ссылки на игроков, по ним идут все группировки статистики
+    winner_id = Column(Integer, ForeignKey('players.id'), index=True)
+    second_place_id = Column(Integer, ForeignKey('players.id'), index=True)
+    # Имена призеров для вывода, обновляются вместе с переименованием игрока
+    winner = Column(String, index=True)
+    second_place = Column(String, index=True)
     rebuys = Column(Integer)
     bank = Column(Float)
     buyin = Column(Float)
@@ -37,78 +62,327 @@ class PokerGame(Base):
     description = Column(String, nullable=True)
 
     # Связь с участниками
-    players = relationship("Player", secondary=game_players_association, backref="poker_games")
+    players = relationship("Player", secondary=game_players_association, backref="poker_games", passive_deletes=True)
+    winner_player = relationship("Player", foreign_keys=[winner_id])
+    second_place_player = relationship("Player", foreign_keys=[second_place_id])
+
+# Накопленная статистика игрока, обновляется вместе с добавлением и удалением игр
+class PlayerStats(Base):
+    __tablename__ = 'player_stats'
+
+    player_id = Column(Integer, ForeignKey('players.id'), primary_key=True)
+    games_all = Column(Integer, nullable=False, default=0)
+    wins_all = Column(Integer, nullable=False, default=0)
+    seconds_all = Column(Integer, nullable=False, default=0)
+    bank_won_all = Column(Float, nullable=False, default=0)
+    # То же, но только по играм начиная с PARTICIPANTS_REQUEST_START_DATE
+    games_recent = Column(Integer, nullable=False, default=0)
+    wins_recent = Column(Integer, nullable=False, default=0)
+    seconds_recent = Column(Integer, nullable=False, default=0)
+    bank_won_recent = Column(Float, nullable=False, default=0)
+
+    player = relationship("Player")
+
+# Сезоны: границы (пустая — без ограничения) и веса побед и вторых мест в очках
+class Season(Base):
+    __tablename__ = 'seasons'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    start_date = Column(Date, nullable=True)
+    end_date = Column(Date, nullable=True)
+    win_weight = Column(Float, nullable=False, default=1.0)
+    second_weight = Column(Float, nullable=False, default=0.33)
+
+# Итоги игроков в сезоне, обновляются вместе с добавлением и удалением игр
+class SeasonResult(Base):
+    __tablename__ = 'season_results'
+
+    season_id = Column(Integer, ForeignKey('seasons.id'), primary_key=True)
+    player_id = Column(Integer, ForeignKey('players.id'), primary_key=True)
+    games = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+    seconds = Column(Integer, nullable=False, default=0)
+
+# Рейтинг игрока после каждой его игры. Игры упорядочены по (дата, id),
+# дата продублирована здесь, чтобы находить точку пересчета без соединения с играми.
+class RatingSnapshot(Base):
+    __tablename__ = 'rating_history'
+
+    game_id = Column(Integer, ForeignKey('poker_games.id', ondelete='CASCADE'), primary_key=True)
+    player_id = Column(Integer, ForeignKey('players.id'), primary_key=True)
+    date = Column(Date, nullable=False)
+    rating = Column(Float, nullable=False)
+    # Сколько рейтинговых игр у игрока с учетом этой
+    games = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_rating_history_player_order', 'player_id', 'date', 'game_id'),
+        Index('ix_rating_history_order', 'date', 'game_id'),
+    )
+
+# Текущий рейтинг игрока — последний снимок из rating_history
+class PlayerRating(Base):
+    __tablename__ = 'player_ratings'
+
+    player_id = Column(Integer, ForeignKey('players.id'), primary_key=True)
+    rating = Column(Float, nullable=False, index=True)
+    games = Column(Integer, nullable=False)
+
+    player = relationship("Player")
+
+# Служебные значения бота (ключ -> значение)
+class Meta(Base):
+    __tablename__ = 'bot_meta'
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+# Сохраненные между перезапусками данные бота: состояния диалогов и user_data
+class PersistedState(Base):
+    __tablename__ = 'bot_persistence'
+
+    # 'user_data' или 'conversation:<имя диалога>'
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(LargeBinary, nullable=False)
+
+# Поколение данных: увеличивается при каждой записи, изменяющей игры.
+# По нему кэши понимают, что их содержимое устарело.
+DATA_GENERATION_KEY = 'data_generation'
+# Поколение состава игроков и списка городов, по нему обновляются клавиатуры бота
+ROSTER_GENERATION_KEY = 'roster_generation'
+# Счетчик удалений игр: после удаления SQLite может выдать новой игре тот же id,
+# поэтому снимки, которые догружают игры по id, по нему понимают, что нужна полная загрузка
+GAMES_DELETED_KEY = 'games_deleted'
+
+def _get_counter(session, key):
+    value = session.query(Meta.value).filter(Meta.key == key).scalar()
+    return int(value) if value is not None else 0
+
+def _bump_counter(session, key):
+    # Выполняется через соединение напрямую: функция вызывается и во время flush
+    meta = Meta.__table__
+    statement = sqlite_insert(meta).values(key=key, value='1')
+    session.connection().execute(statement.on_conflict_do_update(
+        index_elements=[meta.c.key],
+        set_={'value': cast(meta.c.value, Integer) + 1}
+    ))
+
+def get_data_generation(session):
+    return _get_counter(session, DATA_GENERATION_KEY)
+
+def bump_data_generation(session):
+    _bump_counter(session, DATA_GENERATION_KEY)
+    # Копия поколения в памяти сбрасывается, когда транзакция зафиксирована
+    session.info['data_changed'] = True
+
+def get_games_deleted(session):
+    return _get_counter(session, GAMES_DELETED_KEY)
+
+def get_roster_generation(session):
+    return _get_counter(session, ROSTER_GENERATION_KEY)
+
+def bump_roster_generation(session):
+    _bump_counter(session, ROSTER_GENERATION_KEY)
+
+@event.listens_for(Session, 'after_flush')
+def _bump_generation_on_game_change(session, flush_context):
+    changed = session.new | session.dirty | session.deleted
+    if any(isinstance(obj, PokerGame) for obj in changed):
+        bump_data_generation(session)
+    if any(isinstance(obj, PokerGame) for obj in session.deleted):
+        _bump_counter(session, GAMES_DELETED_KEY)
+
+class DataGenerationMirror:
+    # Поколение данных в памяти процесса, чтобы кэши ответов не читали его из базы на каждом запросе.
+    # Записи этого процесса сбрасывают копию сразу после commit, записи других процессов
+    # (importer.py, seasons.py, players.py) видны не позже чем через config.GENERATION_REFRESH_SECONDS.
+
+    def __init__(self):
+        self._generation = None
+        self._checked_at = 0.0
+        # Номер сброса: чтение, начатое до сброса, не должно вернуть в копию старое значение
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def cached(self):
+        # Поколение, если его еще рано сверять с базой, иначе None
+        with self._lock:
+            if self._generation is not None \
+                    and time.monotonic() - self._checked_at < config.GENERATION_REFRESH_SECONDS:
+                return self._generation
+        return None
+
+    def refresh(self, session):
+        with self._lock:
+            epoch = self._epoch
+        generation = get_data_generation(session)
+        with self._lock:
+            if epoch == self._epoch:
+                self._generation = generation
+                self._checked_at = time.monotonic()
+        return generation
+
+    def invalidate(self):
+        with self._lock:
+            self._generation = None
+            self._epoch += 1
+
+data_generation_mirror = DataGenerationMirror()
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_generation_mirror(session):
+    if session.info.pop('data_changed', False):
+        data_generation_mirror.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_data_changes(session):
+    session.info.pop('data_changed', None)
+
+# Функции hook(session, game), которые выполняются в той же транзакции,
+# что и добавление или удаление игры. Их регистрируют модули с производными данными.
+game_added_hooks = []
+game_deleted_hooks = []
+
+def add_game(session, game):
+    session.add(game)
+    session.flush()
+    for hook in game_added_hooks:
+        hook(session, game)
+
+def delete_game(session, game):
+    for hook in game_deleted_hooks:
+        hook(session, game)
+    session.delete(game)
+
+# Функции hook(session, player) после переименования игрока
+player_renamed_hooks = []
+
+def rename_player(session, player, new_name):
+    # Статистика ссылается на игрока по id, поэтому меняется одна строка players
+    # и имена в играх, где он призер (поиск по индексам winner_id/second_place_id)
+    player.name = new_name
+    session.flush()
+    games = PokerGame.__table__
+    session.execute(games.update().where(games.c.winner_id == player.id).values(winner=new_name))
+    session.execute(games.update().where(games.c.second_place_id == player.id).values(second_place=new_name))
+    bump_data_generation(session)
+    for hook in player_renamed_hooks:
+        hook(session, player)
+
+def create_db_engine():
+    # Движок без обращения к базе: соединения открываются при первом запросе
+    engine = create_engine(
+        config.DB_URL,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+    )
+    # WAL, кэш, mmap, busy_timeout и внешние ключи на каждом соединении (storage.py)
+    configure_sqlite(engine)
+    return engine
 
 def init_db():
-    engine = create_engine('sqlite:///poker_games.db')
-    Base.metadata.create_all(engine)
+    engine = create_db_engine()
+    # Схема создается и обновляется миграциями, обычно это одна проверка PRAGMA user_version
+    from migrations import migrate
+    migrate(engine)
     return engine
 
 def get_session(engine):
     Session = sessionmaker(bind=engine)
     return Session()
 
-def generate_pie_chart_stats():
-    session = get_session(init_db())
-    
+# Все обращения к базе выполняются в пуле потоков, чтобы не блокировать event loop бота.
+# Потоков столько же, сколько соединений может выдать пул движка.
+db_executor = ThreadPoolExecutor(
+    max_workers=config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW,
+    thread_name_prefix='db'
+)
+
+# Сессия текущего обновления, открывается декоратором unit_of_work
+_current_session = ContextVar('db_session', default=None)
+
+async def run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    # Контекст (например, метрики текущего обновления) переходит в поток вместе с вызовом
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, functools.partial(context.run, func, *args))
+
+async def run_db(func, *args):
+    # Вызывает func(session, *args) в пуле потоков с сессией текущего обновления.
+    # Каждый вызов — своя транзакция: соединение возвращается в пул сразу, а не держится,
+    # пока обработчик ждет ответа Bot API.
+    session = _current_session.get()
+    if session is None:
+        raise RuntimeError("run_db вызван вне обработчика с unit_of_work")
+    return await run_blocking(_in_transaction, session, func, args)
+
+def _in_transaction(session, func, args):
+    try:
+        result = func(session, *args)
+    except Exception:
+        session.rollback()
+        raise
+    _commit_or_rollback(session)
+    return result
+
+def _commit_or_rollback(session):
+    try:
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+def unit_of_work(engine):
+    # Декоратор обработчика: одна сессия на входящее обновление, транзакции в ней
+    # короткие (по одной на run_db). Загруженные объекты не устаревают после commit,
+    # чтобы обработчик мог показывать их, не обращаясь к базе из event loop.
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            # Вложенный вызов (например, show_all_stats из show_player_stats) использует ту же сессию
+            if _current_session.get() is not None:
+                return await handler(update, context)
+
+            session = Session(bind=engine, expire_on_commit=False)
+            token = _current_session.set(session)
+            try:
+                result = await handler(update, context)
+                if session.in_transaction():
+                    await run_blocking(_commit_or_rollback, session)
+                return result
+            except Exception:
+                if session.in_transaction():
+                    await run_blocking(session.rollback)
+                raise
+            finally:
+                _current_session.reset(token)
+                session.close()
+        return wrapper
+    return decorator
+
+def season_points(wins, seconds, total_games, win_weight=1.0, second_weight=0.33):
+    # Очки = (Винрейт за 1 места) + 0.33 * (Винрейт за 2 места), веса задаются сезоном
+    if total_games == 0:
+        return 0
+    return win_weight * (wins / total_games * 100) + second_weight * (seconds / total_games * 100)
+
+def pie_chart_spec(session):
+    # Данные для диаграммы распределения выигранных банков
     stats = session.query(
-        PokerGame.winner,
+        Player.name,
         func.sum(PokerGame.bank).label('total_bank')
-    ).group_by(PokerGame.winner).all()
+    ).join(Player, Player.id == PokerGame.winner_id)\
+        .group_by(PokerGame.winner_id, Player.name)\
+        .order_by(Player.name).all()
     
     if not stats:
         return None
     
-    players = [stat.winner for stat in stats]
-    banks = [float(stat.total_bank) for stat in stats]
-    total = sum(banks)
-    percentages = [bank/total*100 for bank in banks]
-    
-    plt.figure(figsize=(10, 8))
-    
-    explode = [0.1 if bank == max(banks) else 0 for bank in banks]
-    
-    # Красивые цвета
-    colors = plt.cm.Pastel1(range(len(players)))
-    
-    wedges, texts, autotexts = plt.pie(
-        banks,
-        labels=players,
-        autopct=lambda p: f'{p:.1f}%',
-        startangle=140,
-        colors=colors,
-        explode=explode,
-        shadow=True,
-        textprops={'fontsize': 12}
-    )
-    
-    for autotext in autotexts:
-        autotext.set_color('black')
-        autotext.set_fontsize(12)
-    
-    plt.title('Распределение выигранных банков между игроками', pad=20)
-    
-    legend_labels = [f'{p} - {b:.2f}' for p, b in zip(players, banks)]
-    plt.legend(
-        wedges,
-        legend_labels,
-        title="Игроки и их выигрыш за все время",
-        loc="center left",
-        bbox_to_anchor=(1, 0, 0.5, 1),
-        fontsize=10
-    )
-    plt.setp(autotexts, size=12, weight="bold")  
-
-    centre_circle = plt.Circle((0,0), 0.50, fc='white')
-    fig = plt.gcf()
-    fig.gca().add_artist(centre_circle)
-    plt.text(0, 0, f"Всего разыграно:\n{total:.2f}", ha='center', va='center', fontsize=15)
-    
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-    
-    return buf
\ No newline at end of file
+    return {
+        'type': 'pie',
+        'labels': [stat.name for stat in stats],
+        'values': [float(stat.total_bank) for stat in stats],
+    }
@@ -0,0 +1,105 @@
+import argparse
+import csv
+import os
+import time
+
+from sqlalchemy import func, select
+
+from database import init_db, get_session, PokerGame, Player, game_players_association
+
+# Выгрузка всех игр с участниками в CSV (в формате importer.py) или Parquet:
+#   python exporter.py games.csv
+#   python exporter.py games.parquet
+# Игры читаются из базы пачками, вся таблица в память не загружается.
+
+COLUMNS = (
+    'id', 'date', 'city', 'players_count', 'winner', 'second_place',
+    'rebuys', 'buyin', 'big_blind', 'bank', 'description', 'participants',
+)
+
+
+def iter_games(session, batch_size=1000):
+    # Участники собираются коррелированным подзапросом в той же строке, что и игра
+    participants = select(func.group_concat(Player.name, ';'))\
+        .select_from(game_players_association)\
+        .join(Player, Player.id == game_players_association.c.player_id)\
+        .where(game_players_association.c.game_id == PokerGame.id)\
+        .scalar_subquery()
+    statement = select(
+        PokerGame.id, PokerGame.date, PokerGame.city, PokerGame.players_count,
+        PokerGame.winner, PokerGame.second_place, PokerGame.rebuys, PokerGame.buyin,
+        PokerGame.big_blind, PokerGame.bank, PokerGame.description, participants,
+    ).order_by(PokerGame.id).execution_options(yield_per=batch_size)
+
+    for partition in session.execute(statement).partitions():
+        yield [dict(zip(COLUMNS, row)) for row in partition]
+
+
+def _write_csv(batches, path):
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        writer.writeheader()
+        for batch in batches:
+            for row in batch:
+                row['date'] = row['date'].strftime('%d.%m.%Y') if row['date'] else ''
+                row['participants'] = row['participants'] or ''
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+
+def _write_parquet(batches, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для выгрузки в Parquet нужен пакет pyarrow: pip install pyarrow")
+
+    schema = pa.schema([
+        ('id', pa.int64()), ('date', pa.date32()), ('city', pa.string()), ('players_count', pa.int64()),
+        ('winner', pa.string()), ('second_place', pa.string()), ('rebuys', pa.int64()),
+        ('buyin', pa.float64()), ('big_blind', pa.int64()), ('bank', pa.float64()),
+        ('description', pa.string()), ('participants', pa.list_(pa.string())),
+    ])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            for row in batch:
+                row['participants'] = row['participants'].split(';') if row['participants'] else []
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+WRITERS = {
+    'csv': _write_csv,
+    'parquet': _write_parquet,
+}
+
+
+def export_games(engine, path, export_format='csv', batch_size=1000):
+    # Возвращает число выгруженных игр
+    session = get_session(engine)
+    try:
+        return WRITERS[export_format](iter_games(session, batch_size), path)
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка истории игр в CSV или Parquet")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=sorted(WRITERS),
+                        help="по умолчанию определяется по расширению файла")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    export_format = args.format or ('parquet' if os.path.splitext(args.path)[1].lower() == '.parquet' else 'csv')
+    started = time.perf_counter()
+    count = export_games(init_db(), args.path, export_format, args.batch_size)
+    print(f"Выгружено игр: {count} за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == '__main__':
+    main()
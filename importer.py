@@ -0,0 +1,234 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from database import (
+    init_db, bump_data_generation, PokerGame, Player, game_players_association,
+)
+from ratings import rebuild_ratings
+from search import rebuild_search_index
+from seasons import rebuild_all_season_results
+from stats import rebuild_rollup
+
+# Импорт истории игр из выгрузки таблицы (CSV или XLSX):
+#   python importer.py games.csv
+# Первая строка — заголовки. Обязательные колонки: date, city, players_count, winner, second_place,
+# rebuys, buyin, big_blind. Необязательные: bank (по умолчанию считается как в боте),
+# description, participants (имена через ';').
+
+REQUIRED_COLUMNS = ('date', 'city', 'players_count', 'winner', 'second_place', 'rebuys', 'buyin', 'big_blind')
+DATE_FORMATS = ('%d.%m.%Y', '%Y-%m-%d')
+
+
+def _read_csv(path):
+    # newline='' и utf-8-sig: так csv корректно читает выгрузки Google Sheets и Excel
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        for line, row in enumerate(csv.DictReader(file), 2):
+            yield line, row
+
+
+def _read_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("Для импорта XLSX нужен пакет openpyxl: pip install openpyxl")
+
+    # read_only читает лист потоково, не загружая весь файл в память
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        for line, values in enumerate(rows, 2):
+            if all(value is None for value in values):
+                continue
+            yield line, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    if os.path.splitext(path)[1].lower() in ('.xlsx', '.xlsm'):
+        return _read_xlsx(path)
+    return _read_csv(path)
+
+
+def _text(row, column):
+    value = row.get(column)
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _number(row, column, kind):
+    text = _text(row, column)
+    if not text:
+        raise ValueError(f"не заполнено поле {column}")
+    try:
+        value = float(text.replace(',', '.'))
+    except ValueError:
+        raise ValueError(f"{column}: ожидалось число, получено {text!r}")
+    if value < 0:
+        raise ValueError(f"{column}: отрицательное значение {text!r}")
+    if kind is int:
+        if not value.is_integer():
+            raise ValueError(f"{column}: ожидалось целое число, получено {text!r}")
+        return int(value)
+    return value
+
+
+def _date(row):
+    value = row.get('date')
+    if isinstance(value, datetime):
+        return value.date()
+    text = _text(row, 'date')
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"date: неизвестный формат даты {text!r}")
+
+
+def parse_row(row):
+    # Проверяет строку выгрузки и возвращает данные игры; при ошибке — ValueError с описанием
+    missing = [column for column in REQUIRED_COLUMNS if not _text(row, column)]
+    if missing:
+        raise ValueError(f"не заполнены поля {', '.join(missing)}")
+
+    game = {
+        'date': _date(row),
+        'city': _text(row, 'city'),
+        'players_count': _number(row, 'players_count', int),
+        'winner': _text(row, 'winner'),
+        'second_place': _text(row, 'second_place'),
+        'rebuys': _number(row, 'rebuys', int),
+        'buyin': _number(row, 'buyin', float),
+        'big_blind': _number(row, 'big_blind', int),
+        'description': _text(row, 'description') or None,
+    }
+    if game['winner'] == game['second_place']:
+        raise ValueError("победитель и второе место совпадают")
+
+    if _text(row, 'bank'):
+        game['bank'] = _number(row, 'bank', float)
+    else:
+        # Так же, как банк считается при добавлении игры в боте
+        game['bank'] = round((game['players_count'] + game['rebuys']) * game['buyin'], 2)
+
+    participants = [game['winner'], game['second_place']]
+    for name in _text(row, 'participants').split(';'):
+        name = name.strip()
+        if name and name not in participants:
+            participants.append(name)
+    if len(participants) > game['players_count']:
+        raise ValueError(f"участников ({len(participants)}) больше, чем players_count ({game['players_count']})")
+    game['participants'] = participants
+    return game
+
+
+def _player_ids(connection, names, known):
+    # Недостающие игроки добавляются одним запросом, их id читаются другим
+    new_names = sorted(set(names) - set(known))
+    if not new_names:
+        return
+    connection.execute(
+        insert(Player.__table__).on_conflict_do_nothing(index_elements=['name']),
+        [{'name': name} for name in new_names]
+    )
+    players = Player.__table__
+    rows = connection.execute(select(players.c.id, players.c.name).where(players.c.name.in_(new_names)))
+    known.update((name, player_id) for player_id, name in rows)
+
+
+def _insert_batch(connection, batch, next_id, known):
+    _player_ids(connection, [name for _, game in batch for name in game['participants']], known)
+
+    game_rows = []
+    association_rows = []
+    for game_id, (_, game) in enumerate(batch, next_id):
+        row = {key: value for key, value in game.items() if key != 'participants'}
+        row['id'] = game_id
+        row['winner_id'] = known[game['winner']]
+        row['second_place_id'] = known[game['second_place']]
+        game_rows.append(row)
+        association_rows.extend(
+            {'game_id': game_id, 'player_id': known[name]} for name in game['participants']
+        )
+
+    connection.execute(PokerGame.__table__.insert(), game_rows)
+    connection.execute(game_players_association.insert(), association_rows)
+    return next_id + len(batch)
+
+
+def import_games(engine, rows, batch_size=1000):
+    # Все строки импортируются в одной транзакции пачками по batch_size (executemany).
+    # Ошибочные строки пропускаются и возвращаются списком (номер строки, описание).
+    errors = []
+    imported = 0
+    with engine.connect() as connection:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            players = Player.__table__
+            known = {name: player_id for player_id, name in connection.execute(select(players.c.id, players.c.name))}
+            next_id = (connection.exec_driver_sql("SELECT max(id) FROM poker_games").scalar() or 0) + 1
+
+            batch = []
+            for line, row in rows:
+                try:
+                    batch.append((line, parse_row(row)))
+                except ValueError as e:
+                    errors.append((line, str(e)))
+                    continue
+                if len(batch) >= batch_size:
+                    next_id = _insert_batch(connection, batch, next_id, known)
+                    imported += len(batch)
+                    batch = []
+            if batch:
+                _insert_batch(connection, batch, next_id, known)
+                imported += len(batch)
+
+            if imported:
+                # Производные данные пересчитываются один раз после всех вставок
+                session = Session(bind=connection)
+                rebuild_rollup(session)
+                rebuild_all_season_results(session)
+                rebuild_ratings(session)
+                bump_data_generation(session)
+                session.flush()
+                rebuild_search_index(connection)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    return imported, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт истории игр из CSV или XLSX")
+    parser.add_argument('path')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = init_db()
+    started = time.perf_counter()
+    try:
+        imported, errors = import_games(engine, read_rows(args.path), args.batch_size)
+    except RuntimeError as error:
+        # Например, нет openpyxl для XLSX
+        sys.exit(str(error))
+    elapsed = time.perf_counter() - started
+
+    for line, message in errors:
+        print(f"Строка {line}: {message}")
+    print(f"Импортировано игр: {imported} за {elapsed:.1f} с, строк с ошибками: {len(errors)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import logging
+import time
+
+from database import init_db
+
+logger = logging.getLogger(__name__)
+
+# Обслуживание базы: удаление осиротевших строк, статистика планировщика (ANALYZE),
+# возврат свободных страниц (incremental vacuum), сброс журнала WAL и проверка целостности.
+# Бот запускает его раз в сутки в config.MAINTENANCE_TIME, вручную: python maintenance.py
+
+# Строки, которые ссылаются на удаленные игры или игроков
+ORPHAN_SWEEPS = {
+    'game_players_association': """
+        DELETE FROM game_players_association
+        WHERE game_id NOT IN (SELECT id FROM poker_games) OR player_id NOT IN (SELECT id FROM players)
+    """,
+    'rating_history': """
+        DELETE FROM rating_history WHERE game_id NOT IN (SELECT id FROM poker_games)
+    """,
+}
+
+# PRAGMA auto_vacuum: 2 — INCREMENTAL
+INCREMENTAL_AUTO_VACUUM = 2
+
+
+def sweep_orphans(connection):
+    # Возвращает {таблица: удалено строк} для таблиц, где что-то нашлось
+    removed = {}
+    for table, statement in ORPHAN_SWEEPS.items():
+        count = connection.exec_driver_sql(statement).rowcount
+        if count:
+            removed[table] = count
+    return removed
+
+
+def _pragma(connection, name):
+    return connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+
+def _file_size(connection):
+    return _pragma(connection, 'page_count') * _pragma(connection, 'page_size')
+
+
+class MaintenanceReport:
+    def __init__(self):
+        # Время каждого шага в секундах, по порядку выполнения
+        self.timings = {}
+        self.size_before = 0
+        self.size_after = 0
+        self.orphans = {}
+        # True, если база впервые переводилась в режим incremental vacuum полным VACUUM
+        self.full_vacuum = False
+        self.integrity_errors = []
+        self.foreign_key_errors = 0
+
+    @property
+    def total_seconds(self):
+        return sum(self.timings.values())
+
+    @property
+    def reclaimed(self):
+        return self.size_before - self.size_after
+
+    @property
+    def ok(self):
+        return not self.integrity_errors and not self.foreign_key_errors
+
+    def describe(self):
+        steps = ', '.join(f"{step} {seconds * 1000:.0f} ms" for step, seconds in self.timings.items())
+        return (
+            f"{self.total_seconds:.2f} s ({steps}), size {self.size_before} -> {self.size_after} bytes, "
+            f"reclaimed {self.reclaimed} bytes, orphans {self.orphans or 0}, "
+            f"integrity {'ok' if self.ok else 'FAILED'}"
+        )
+
+
+def _sweep(connection, report):
+    report.orphans = sweep_orphans(connection)
+
+
+def _analyze(connection, report):
+    connection.exec_driver_sql("ANALYZE")
+    connection.exec_driver_sql("PRAGMA optimize")
+
+
+def _vacuum(connection, report):
+    if _pragma(connection, 'auto_vacuum') == INCREMENTAL_AUTO_VACUUM:
+        # Через execute sqlite3 выполняет только первый шаг (одна страница), executescript — все
+        connection.connection.driver_connection.executescript("PRAGMA incremental_vacuum")
+    else:
+        # Режим auto_vacuum меняется только полным VACUUM, дальше хватает incremental_vacuum
+        connection.exec_driver_sql(f"PRAGMA auto_vacuum = {INCREMENTAL_AUTO_VACUUM}")
+        connection.exec_driver_sql("VACUUM")
+        report.full_vacuum = True
+
+
+def _checkpoint(connection, report):
+    # В режиме WAL переносим журнал в базу и обрезаем файл -wal
+    if _pragma(connection, 'journal_mode') == 'wal':
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+def _check(connection, report):
+    report.integrity_errors = [
+        row[0] for row in connection.exec_driver_sql("PRAGMA integrity_check") if row[0] != 'ok'
+    ]
+    report.foreign_key_errors = len(connection.exec_driver_sql("PRAGMA foreign_key_check").fetchall())
+
+
+STEPS = [
+    ('orphans', _sweep),
+    ('analyze', _analyze),
+    ('vacuum', _vacuum),
+    ('checkpoint', _checkpoint),
+    ('integrity', _check),
+]
+
+
+def run_maintenance(engine):
+    report = MaintenanceReport()
+    with engine.connect() as connection:
+        # Каждая команда — отдельная транзакция: VACUUM внутри транзакции невозможен,
+        # а короткие шаги не держат блокировку на запись дольше нужного
+        connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        report.size_before = _file_size(connection)
+        for name, step in STEPS:
+            started = time.perf_counter()
+            step(connection, report)
+            report.timings[name] = time.perf_counter() - started
+        report.size_after = _file_size(connection)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных")
+    parser.parse_args()
+
+    report = run_maintenance(init_db())
+    for step, seconds in report.timings.items():
+        print(f"{step}: {seconds * 1000:.0f} мс")
+    if report.orphans:
+        print(f"Удалено осиротевших строк: {report.orphans}")
+    if report.full_vacuum:
+        print("База переведена в режим incremental vacuum")
+    print(f"Размер базы: {report.size_before} -> {report.size_after} байт, освобождено {report.reclaimed} байт")
+    if report.ok:
+        print("Проверка целостности: ok")
+    else:
+        for error in report.integrity_errors:
+            print(f"Ошибка целостности: {error}")
+        if report.foreign_key_errors:
+            print(f"Нарушений внешних ключей: {report.foreign_key_errors}")
+
+
+if __name__ == '__main__':
+    main()
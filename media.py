@@ -0,0 +1,58 @@
+import logging
+
+from sqlalchemy.dialects.sqlite import insert
+from telegram.error import BadRequest
+
+from database import Meta, run_db
+
+logger = logging.getLogger(__name__)
+
+# Telegram возвращает file_id для каждого загруженного файла. Повторная отправка по file_id
+# не требует загрузки файла, поэтому id сохраняются в bot_meta под ключом 'file_id:<ключ>'.
+# Вместе с id хранится версия содержимого: при ее смене файл загружается заново.
+
+FILE_ID_PREFIX = 'file_id:'
+
+# ключ -> (версия, file_id), чтобы не ходить в базу на каждую отправку
+_file_ids = {}
+
+
+def _load_file_id(session, key):
+    meta = session.get(Meta, FILE_ID_PREFIX + key)
+    if meta is None:
+        return None
+    version, _, file_id = meta.value.partition(':')
+    return version, file_id
+
+
+def _save_file_id(session, key, version, file_id):
+    # Одну и ту же картинку могут одновременно загрузить несколько чатов, поэтому upsert
+    statement = insert(Meta).values(key=FILE_ID_PREFIX + key, value=f'{version}:{file_id}')
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[Meta.key], set_={'value': statement.excluded.value}
+    ))
+    session.commit()
+
+
+async def send_cached_photo(bot, chat_id, key, version, load_photo, **kwargs):
+    # load_photo — корутина, возвращающая содержимое фото; вызывается только если file_id нет
+    version = str(version)
+    cached = _file_ids.get(key)
+    if cached is None:
+        cached = await run_db(_load_file_id, key)
+        if cached:
+            _file_ids[key] = cached
+
+    if cached and cached[0] == version:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=cached[1], **kwargs)
+        except BadRequest as e:
+            # Telegram может не принять старый id, тогда просто загружаем файл заново
+            logger.warning(f"Cached file_id for {key} was rejected: {e}")
+            _file_ids.pop(key, None)
+
+    message = await bot.send_photo(chat_id=chat_id, photo=await load_photo(), **kwargs)
+    file_id = message.photo[-1].file_id
+    _file_ids[key] = (version, file_id)
+    await run_db(_save_file_id, key, version, file_id)
+    return message
@@ -0,0 +1,268 @@
+import asyncio
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from telegram.request import BaseRequest
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Метрики бота в текстовом формате Prometheus: время обработчиков, SQL-запросы,
+# вызовы Bot API и отрисовка диаграмм. Отдаются по HTTP на config.METRICS_PORT.
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    # Гистограмма с метками; наблюдения приходят и из event loop, и из потоков базы
+    def __init__(self, name, help_text, label_names, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # счетчики по корзинам, сумма, количество
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(buckets), total, count) for labels, (buckets, total, count) in self._series.items()]
+        for labels, buckets, total, count in sorted(series):
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = f"{label_text}," if label_text else ''
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, buckets):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f"{{{label_text}}}" if label_text else ''
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return '\n'.join(lines)
+
+
+class Counter:
+    # Счетчик с метками
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, value in series:
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            suffix = f"{{{label_text}}}" if label_text else ''
+            lines.append(f"{self.name}{suffix} {value}")
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+handler_seconds = Histogram(
+    'pokerbot_handler_seconds', "Время обработки обновления", ('state', 'handler'))
+handler_sql_queries = Histogram(
+    'pokerbot_handler_sql_queries', "SQL-запросов на одно обновление", ('handler',), COUNT_BUCKETS)
+sql_seconds = Histogram(
+    'pokerbot_sql_seconds', "Время выполнения SQL-запроса", ())
+bot_api_seconds = Histogram(
+    'pokerbot_bot_api_seconds', "Время вызова Bot API", ('method',))
+chart_seconds = Histogram(
+    'pokerbot_chart_render_seconds', "Время отрисовки диаграммы", ('type',))
+
+response_cache_requests = Counter(
+    'pokerbot_response_cache_requests_total', "Обращения к кэшу ответов меню", ('handler', 'result'))
+
+HISTOGRAMS = [handler_seconds, handler_sql_queries, sql_seconds, bot_api_seconds, chart_seconds]
+COUNTERS = [response_cache_requests]
+
+
+class UpdateMetrics:
+    # Из чего сложилось время одного обновления, для журнала медленных обновлений
+    def __init__(self, state, handler):
+        self.state = state
+        self.handler = handler
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.api_count = 0
+        self.api_time = 0.0
+        self.chart_time = 0.0
+
+
+# Метрики текущего обновления. run_blocking копирует контекст в поток базы,
+# поэтому SQL-запросы из потоков попадают в метрики своего обновления.
+_current_update = ContextVar('update_metrics', default=None)
+
+
+def render_metrics():
+    return '\n'.join(metric.render() for metric in HISTOGRAMS + COUNTERS) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    sql_seconds.observe(elapsed)
+    current = _current_update.get()
+    if current is not None:
+        current.sql_count += 1
+        current.sql_time += elapsed
+
+
+def instrument_engine(engine):
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def observe_chart(chart_type, elapsed):
+    chart_seconds.observe(elapsed, chart_type)
+    current = _current_update.get()
+    if current is not None:
+        current.chart_time += elapsed
+
+
+def _wrap_handler(callback, state):
+    handler = getattr(callback, '__name__', repr(callback))
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        current = UpdateMetrics(state, handler)
+        token = _current_update.set(current)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_update.reset(token)
+            handler_seconds.observe(elapsed, state, handler)
+            handler_sql_queries.observe(current.sql_count, handler)
+            if elapsed >= config.SLOW_UPDATE_SECONDS:
+                logger.warning(
+                    f"Slow update {getattr(update, 'update_id', None)}: state {state}, handler {handler}, "
+                    f"total {elapsed * 1000:.0f} ms, SQL {current.sql_count} queries {current.sql_time * 1000:.0f} ms, "
+                    f"Bot API {current.api_count} calls {current.api_time * 1000:.0f} ms, "
+                    f"charts {current.chart_time * 1000:.0f} ms"
+                )
+    return wrapper
+
+
+def instrument_conversation(conversation, state_names=None):
+    # Оборачивает обработчики входа, всех состояний и fallbacks диалога.
+    # state_names: {состояние: имя} для меток; по умолчанию — номер состояния.
+    state_names = state_names or {}
+    groups = [('entry', conversation.entry_points), ('fallback', conversation.fallbacks)]
+    groups += [(state_names.get(state, str(state)), handlers) for state, handlers in conversation.states.items()]
+    for state, handlers in groups:
+        for handler in handlers:
+            handler.callback = _wrap_handler(handler.callback, state)
+
+
+class InstrumentedRequest(BaseRequest):
+    # Обертка над запросами к Bot API, замеряет каждый вызов
+    def __init__(self, request):
+        self._request = request
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def shutdown(self):
+        await self._request.shutdown()
+
+    @property
+    def read_timeout(self):
+        return self._request.read_timeout
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        started = time.perf_counter()
+        try:
+            return await self._request.do_request(
+                url, method, request_data=request_data, read_timeout=read_timeout,
+                write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout
+            )
+        finally:
+            elapsed = time.perf_counter() - started
+            bot_api_seconds.observe(elapsed, url.rsplit('/', 1)[-1])
+            current = _current_update.get()
+            if current is not None:
+                current.api_count += 1
+                current.api_time += elapsed
+
+
+class MetricsServer:
+    # Минимальный HTTP-сервер: на любой GET отдает текущие метрики
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        if self.port <= 0 or self._server is not None:
+            return
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Metrics are served on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны, дочитываем их до пустой строки
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            if request_line.split(b' ')[0] == b'GET':
+                body = render_metrics().encode()
+                status = b'200 OK'
+            else:
+                body = b''
+                status = b'405 Method Not Allowed'
+            writer.write(
+                b'HTTP/1.1 ' + status + b'\r\n'
+                b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                b'Connection: close\r\n\r\n' + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+metrics_server = MetricsServer(config.METRICS_LISTEN, config.METRICS_PORT)
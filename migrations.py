@@ -0,0 +1,279 @@
+import logging
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from database import Base, PersistedState
+from maintenance import sweep_orphans
+from search import create_fts_table, rebuild_search_index
+from ratings import rebuild_ratings
+from roster import LEGACY_ROSTER
+from seasons import rebuild_all_season_results
+
+logger = logging.getLogger(__name__)
+
+# Версия схемы хранится в PRAGMA user_version самой базы.
+# Каждая миграция — функция(connection), которая переводит базу на свою версию.
+# Новую базу create_all сразу создает в последней версии, миграции нужны для уже существующих.
+
+
+def _add_indexes(connection):
+    # Индексы для фильтров, сортировки и соединений в обработчиках бота
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_poker_games_date ON poker_games (date)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_poker_games_city ON poker_games (city)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_poker_games_winner ON poker_games (winner)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_poker_games_second_place ON poker_games (second_place)")
+
+
+def _association_primary_key(connection):
+    # В SQLite нельзя добавить первичный ключ к таблице, поэтому пересоздаем ее.
+    # Дубли и строки с пустыми ссылками при копировании отбрасываются.
+    connection.exec_driver_sql("""
+        CREATE TABLE game_players_association_new (
+            game_id INTEGER NOT NULL,
+            player_id INTEGER NOT NULL,
+            PRIMARY KEY (game_id, player_id),
+            FOREIGN KEY(game_id) REFERENCES poker_games (id),
+            FOREIGN KEY(player_id) REFERENCES players (id)
+        )
+    """)
+    connection.exec_driver_sql("""
+        INSERT OR IGNORE INTO game_players_association_new (game_id, player_id)
+        SELECT game_id, player_id FROM game_players_association
+        WHERE game_id IS NOT NULL AND player_id IS NOT NULL
+    """)
+    connection.exec_driver_sql("DROP TABLE game_players_association")
+    connection.exec_driver_sql("ALTER TABLE game_players_association_new RENAME TO game_players_association")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_game_players_association_player_id "
+        "ON game_players_association (player_id)"
+    )
+
+
+def _fill_player_stats_by_name(connection):
+    # Миграция 3 в том виде, в каком она применялась: призеры тогда определялись по именам,
+    # колонок winner_id/second_place_id еще нет, поэтому запрос не зависит от stats.py.
+    # Таблицу player_stats создает create_all.
+    recent = "g.date >= '2025-05-27'"
+    connection.exec_driver_sql("DELETE FROM player_stats")
+    connection.exec_driver_sql(f"""
+        INSERT INTO player_stats (
+            player_id, games_all, wins_all, seconds_all, bank_won_all,
+            games_recent, wins_recent, seconds_recent, bank_won_recent
+        )
+        SELECT
+            p.id,
+            count(g.id),
+            sum(CASE WHEN g.winner = p.name THEN 1 ELSE 0 END),
+            sum(CASE WHEN g.second_place = p.name THEN 1 ELSE 0 END),
+            total(CASE WHEN g.winner = p.name THEN g.bank ELSE 0 END),
+            sum(CASE WHEN {recent} THEN 1 ELSE 0 END),
+            sum(CASE WHEN {recent} AND g.winner = p.name THEN 1 ELSE 0 END),
+            sum(CASE WHEN {recent} AND g.second_place = p.name AND g.winner IS NOT p.name THEN 1 ELSE 0 END),
+            total(CASE WHEN {recent} AND g.winner = p.name THEN g.bank ELSE 0 END)
+        FROM players p
+        JOIN game_players_association a ON a.player_id = p.id
+        JOIN poker_games g ON g.id = a.game_id
+        GROUP BY p.id
+    """)
+
+
+def _build_player_stats(connection):
+    # Накопленная статистика для базы, в которой уже есть игры
+    from stats import rebuild_rollup
+    session = Session(bind=connection)
+    rebuild_rollup(session)
+    session.flush()
+
+
+def _build_search_index(connection):
+    connection.execute(create_fts_table)
+    rebuild_search_index(connection)
+
+
+def _create_persistence_table(connection):
+    PersistedState.__table__.create(connection, checkfirst=True)
+
+
+def _prize_player_ids(connection):
+    # Призеры становятся ссылками на игроков. Имена, которых еще нет в players, добавляются.
+    connection.exec_driver_sql("ALTER TABLE poker_games ADD COLUMN winner_id INTEGER REFERENCES players (id)")
+    connection.exec_driver_sql("ALTER TABLE poker_games ADD COLUMN second_place_id INTEGER REFERENCES players (id)")
+    connection.exec_driver_sql("""
+        INSERT OR IGNORE INTO players (name)
+        SELECT winner FROM poker_games WHERE winner IS NOT NULL
+        UNION
+        SELECT second_place FROM poker_games WHERE second_place IS NOT NULL
+    """)
+    connection.exec_driver_sql("""
+        UPDATE poker_games SET
+            winner_id = (SELECT id FROM players WHERE name = poker_games.winner),
+            second_place_id = (SELECT id FROM players WHERE name = poker_games.second_place)
+    """)
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_poker_games_winner_id ON poker_games (winner_id)")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_poker_games_second_place_id ON poker_games (second_place_id)"
+    )
+    # Накопленная статистика считается по id
+    _build_player_stats(connection)
+
+
+def _build_season_results(connection):
+    # Таблицы seasons и season_results создает create_all (вместе с прежними сезонами),
+    # здесь итоги сезонов считаются по уже записанным играм
+    session = Session(bind=connection)
+    rebuild_all_season_results(session)
+    session.flush()
+
+
+def _build_ratings(connection):
+    # Таблицы rating_history и player_ratings создает create_all, рейтинг считается по всей истории
+    session = Session(bind=connection)
+    rebuild_ratings(session)
+    session.flush()
+
+
+def _roster_column(connection):
+    # Состав для клавиатур переезжает из кода в players.in_roster (города — в таблицу cities,
+    # ее вместе с прежними городами создает create_all)
+    connection.exec_driver_sql("ALTER TABLE players ADD COLUMN in_roster BOOLEAN NOT NULL DEFAULT 0")
+    connection.exec_driver_sql(
+        "INSERT OR IGNORE INTO players (name) VALUES " + ", ".join("(?)" for _ in LEGACY_ROSTER),
+        tuple(LEGACY_ROSTER),
+    )
+    connection.exec_driver_sql(
+        "UPDATE players SET in_roster = 1 WHERE name IN (" + ", ".join("?" for _ in LEGACY_ROSTER) + ")",
+        tuple(LEGACY_ROSTER),
+    )
+
+
+def _cascade_association(connection):
+    # Связи игры с участниками удаляются вместе с игрой (ON DELETE CASCADE).
+    # Связи с уже несуществующими играми и игроками удаляются до переноса.
+    removed = sweep_orphans(connection)
+    if removed:
+        logger.info(f"Removed orphan rows: {removed}")
+    connection.exec_driver_sql("""
+        CREATE TABLE game_players_association_new (
+            game_id INTEGER NOT NULL,
+            player_id INTEGER NOT NULL,
+            PRIMARY KEY (game_id, player_id),
+            FOREIGN KEY(game_id) REFERENCES poker_games (id) ON DELETE CASCADE,
+            FOREIGN KEY(player_id) REFERENCES players (id)
+        )
+    """)
+    connection.exec_driver_sql(
+        "INSERT INTO game_players_association_new (game_id, player_id) "
+        "SELECT game_id, player_id FROM game_players_association"
+    )
+    connection.exec_driver_sql("DROP TABLE game_players_association")
+    connection.exec_driver_sql("ALTER TABLE game_players_association_new RENAME TO game_players_association")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_game_players_association_player_id "
+        "ON game_players_association (player_id)"
+    )
+
+
+def _rebuild_player_stats(connection):
+    # Миграция 3 считала статистику по именам призеров, здесь она пересчитывается
+    # по winner_id/second_place_id, как ее дальше ведут обработчики
+    _build_player_stats(connection)
+
+
+def _cascade_rating_history(connection):
+    # Снимки рейтинга удаляются вместе с игрой, иначе при включенных внешних ключах
+    # игру нельзя удалить запросом в обход delete_game
+    removed = sweep_orphans(connection)
+    if removed:
+        logger.info(f"Removed orphan rows: {removed}")
+    connection.exec_driver_sql("""
+        CREATE TABLE rating_history_new (
+            game_id INTEGER NOT NULL,
+            player_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            rating FLOAT NOT NULL,
+            games INTEGER NOT NULL,
+            PRIMARY KEY (game_id, player_id),
+            FOREIGN KEY(game_id) REFERENCES poker_games (id) ON DELETE CASCADE,
+            FOREIGN KEY(player_id) REFERENCES players (id)
+        )
+    """)
+    connection.exec_driver_sql(
+        "INSERT INTO rating_history_new (game_id, player_id, date, rating, games) "
+        "SELECT game_id, player_id, date, rating, games FROM rating_history"
+    )
+    connection.exec_driver_sql("DROP TABLE rating_history")
+    connection.exec_driver_sql("ALTER TABLE rating_history_new RENAME TO rating_history")
+    connection.exec_driver_sql(
+        "CREATE INDEX ix_rating_history_player_order ON rating_history (player_id, date, game_id)"
+    )
+    connection.exec_driver_sql("CREATE INDEX ix_rating_history_order ON rating_history (date, game_id)")
+
+
+MIGRATIONS = [
+    (1, _add_indexes),
+    (2, _association_primary_key),
+    (3, _fill_player_stats_by_name),
+    (4, _build_search_index),
+    (5, _create_persistence_table),
+    (6, _prize_player_ids),
+    (7, _build_season_results),
+    (8, _build_ratings),
+    (9, _roster_column),
+    (10, _cascade_association),
+    (11, _cascade_rating_history),
+    (12, _rebuild_player_stats),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def _set_schema_version(connection, version):
+    connection.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def migrate(engine):
+    with engine.connect() as connection:
+        if get_schema_version(connection) == SCHEMA_VERSION:
+            return
+
+        # Миграции пересоздают таблицы, поэтому внешние ключи на это время выключены
+        # (вне транзакции: внутри нее PRAGMA foreign_keys не действует)
+        foreign_keys = connection.exec_driver_sql("PRAGMA foreign_keys").scalar()
+        connection.exec_driver_sql("PRAGMA foreign_keys = OFF")
+        try:
+            _migrate(connection)
+        finally:
+            connection.exec_driver_sql(f"PRAGMA foreign_keys = {int(foreign_keys)}")
+
+
+def _migrate(connection):
+    # Вся миграция в одной транзакции, блокировка на запись берется сразу
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        version = get_schema_version(connection)
+        if version == SCHEMA_VERSION:
+            connection.rollback()
+            return
+
+        is_new_database = not inspect(connection).has_table('poker_games')
+        # Таблицы, которых еще нет в базе, создаются сразу в актуальном виде
+        Base.metadata.create_all(connection)
+
+        if is_new_database:
+            _set_schema_version(connection, SCHEMA_VERSION)
+        else:
+            for target, migration in MIGRATIONS:
+                if target > version:
+                    logger.info(f"Migrating database schema to version {target}: {migration.__name__}")
+                    migration(connection)
+                    _set_schema_version(connection, target)
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import pickle
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import PersistedState, get_session, run_blocking
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CONVERSATION_PREFIX = 'conversation:'
+
+
+class SQLitePersistence(BasePersistence):
+    # Хранит состояния диалогов и user_data в таблице bot_persistence, чтобы незаконченное
+    # добавление игры переживало перезапуск бота. Каждый пользователь и каждый диалог — отдельная
+    # строка, поэтому записываются только изменившиеся значения. Application передает изменения
+    # раз в update_interval секунд, и все они сохраняются одной транзакцией.
+
+    def __init__(self, engine, update_interval=60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.engine = engine
+        # (kind, key) -> последнее записанное значение, чтобы не писать неизменившееся
+        self._written = {}
+        # (kind, key) -> новое значение или None для удаления
+        self._pending = {}
+        # Единственная задача записи: изменения пишутся по очереди, и старое значение
+        # не может перезаписать более новое
+        self._write_task = None
+
+    def _load(self, kind):
+        session = get_session(self.engine)
+        try:
+            rows = session.query(PersistedState.key, PersistedState.value)\
+                .filter(PersistedState.kind == kind).all()
+        finally:
+            session.close()
+        for key, value in rows:
+            self._written[(kind, key)] = value
+        return rows
+
+    def _write(self, changes):
+        session = get_session(self.engine)
+        try:
+            for (kind, key), value in changes.items():
+                if value is None:
+                    session.query(PersistedState).filter_by(kind=kind, key=key).delete()
+                else:
+                    session.merge(PersistedState(kind=kind, key=key, value=value))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def _flush_pending(self):
+        # Даем Application передать все изменения этого прохода, затем пишем их разом.
+        # Изменения, пришедшие во время записи, пишутся следующей транзакцией.
+        await asyncio.sleep(0)
+        try:
+            while self._pending:
+                changes, self._pending = self._pending, {}
+                try:
+                    await run_blocking(self._write, changes)
+                except Exception as e:
+                    logger.error(f"Error while saving persistence: {e}")
+                    # Несохраненное попробуем записать вместе со следующими изменениями
+                    for item, value in changes.items():
+                        self._pending.setdefault(item, value)
+                    break
+        finally:
+            self._write_task = None
+
+    def _stage(self, kind, key, value):
+        item = (kind, key)
+        if value is not None and self._written.get(item) == value:
+            return
+        if value is None and item not in self._written and item not in self._pending:
+            return
+        self._pending[item] = value
+        if value is None:
+            self._written.pop(item, None)
+        else:
+            self._written[item] = value
+        if self._write_task is None:
+            self._write_task = asyncio.create_task(self._flush_pending())
+
+    async def get_user_data(self):
+        rows = await run_blocking(self._load, USER_DATA)
+        return {int(key): pickle.loads(value) for key, value in rows}
+
+    async def update_user_data(self, user_id, data):
+        # Пустой user_data (после отмены или завершения диалога) не храним
+        self._stage(USER_DATA, str(user_id), pickle.dumps(data) if data else None)
+
+    async def drop_user_data(self, user_id):
+        self._stage(USER_DATA, str(user_id), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def get_conversations(self, name):
+        rows = await run_blocking(self._load, CONVERSATION_PREFIX + name)
+        return {tuple(json.loads(key)): pickle.loads(value) for key, value in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        value = pickle.dumps(new_state) if new_state is not None else None
+        self._stage(CONVERSATION_PREFIX + name, json.dumps(list(key)), value)
+
+    async def flush(self):
+        while self._write_task is not None:
+            await self._write_task
+        if self._pending:
+            await self._flush_pending()
+
+    # chat_data, bot_data и callback_data бот не использует
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
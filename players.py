@@ -0,0 +1,106 @@
+import argparse
+import sys
+
+from database import init_db, get_session, rename_player, City, Player
+from roster import roster_changed
+
+
+def _list(session, args):
+    for player in session.query(Player).filter(Player.in_roster.is_(True)).order_by(Player.name):
+        print(player.name)
+
+
+def _add(session, args):
+    player = session.query(Player).filter_by(name=args.name).first()
+    if player is None:
+        player = Player(name=args.name)
+        session.add(player)
+    elif player.in_roster:
+        print(f"Игрок {args.name} уже в составе")
+        sys.exit(1)
+    player.in_roster = True
+    roster_changed(session)
+    print(f"Игрок {args.name} добавлен в состав")
+
+
+def _remove(session, args):
+    # Игрок остается в базе со всей статистикой, но пропадает с клавиатур бота
+    player = session.query(Player).filter_by(name=args.name, in_roster=True).first()
+    if player is None:
+        print(f"Игрока {args.name} нет в составе")
+        sys.exit(1)
+    player.in_roster = False
+    roster_changed(session)
+    print(f"Игрок {args.name} убран из состава")
+
+
+def _rename(session, args):
+    player = session.query(Player).filter_by(name=args.old_name).first()
+    if player is None:
+        print(f"Игрок {args.old_name} не найден")
+        sys.exit(1)
+    if session.query(Player).filter_by(name=args.new_name).first() is not None:
+        print(f"Игрок {args.new_name} уже есть в базе")
+        sys.exit(1)
+    rename_player(session, player, args.new_name)
+    print(f"Игрок {args.old_name} переименован в {args.new_name}")
+
+
+def _cities(session, args):
+    for city in session.query(City).order_by(City.id):
+        print(city.name)
+
+
+def _add_city(session, args):
+    if session.query(City).filter_by(name=args.name).first() is not None:
+        print(f"Город {args.name} уже есть")
+        sys.exit(1)
+    session.add(City(name=args.name))
+    roster_changed(session)
+    print(f"Город {args.name} добавлен")
+
+
+def _remove_city(session, args):
+    # Игры в этом городе остаются, город только пропадает с клавиатуры
+    city = session.query(City).filter_by(name=args.name).first()
+    if city is None:
+        print(f"Города {args.name} нет в списке")
+        sys.exit(1)
+    session.delete(city)
+    roster_changed(session)
+    print(f"Город {args.name} убран из списка")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Управление игроками и городами")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="Показать текущий состав").set_defaults(func=_list)
+    add = subparsers.add_parser('add', help="Добавить игрока в состав")
+    add.add_argument('name')
+    add.set_defaults(func=_add)
+    remove = subparsers.add_parser('remove', help="Убрать игрока из состава (статистика сохраняется)")
+    remove.add_argument('name')
+    remove.set_defaults(func=_remove)
+    rename = subparsers.add_parser('rename', help="Переименовать игрока во всей статистике")
+    rename.add_argument('old_name')
+    rename.add_argument('new_name')
+    rename.set_defaults(func=_rename)
+    subparsers.add_parser('cities', help="Показать список городов").set_defaults(func=_cities)
+    add_city = subparsers.add_parser('add-city', help="Добавить город")
+    add_city.add_argument('name')
+    add_city.set_defaults(func=_add_city)
+    remove_city = subparsers.add_parser('remove-city', help="Убрать город из списка")
+    remove_city.add_argument('name')
+    remove_city.set_defaults(func=_remove_city)
+    args = parser.parse_args()
+
+    session = get_session(init_db())
+    try:
+        args.func(session, args)
+        session.commit()
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import argparse
+
+from sqlalchemy import select, tuple_
+
+from database import (
+    init_db, get_session, bump_data_generation, PokerGame, Player, PlayerRating, RatingSnapshot,
+    game_players_association, game_added_hooks, game_deleted_hooks,
+)
+
+# Рейтинг Эло для игр на несколько участников. Игры обрабатываются по порядку (дата, id):
+# победитель обыгрывает всех, второе место — всех, кроме победителя, остальные делят
+# места между собой. Ожидаемый результат игрока считается против среднего рейтинга
+# остальных за столом, поэтому пересчет одной игры — O(участников).
+# В старых играх записаны только призеры, остальные players_count - 2 игроков
+# считаются соперниками с начальным рейтингом.
+#
+# После каждой игры в rating_history сохраняется рейтинг ее участников. Новая игра в конце
+# истории пересчитывает только себя; игра, добавленная или удаленная в прошлом, —
+# себя и все игры после нее, начиная с последних снимков рейтинга до этой точки.
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32.0
+
+
+def _expected_score(rating, opponents_rating):
+    return 1 / (1 + 10 ** ((opponents_rating - rating) / 400))
+
+
+def rate_game(ratings, participants, winner_id, second_place_id, players_count):
+    # Новые рейтинги участников игры {player_id: рейтинг}; ratings — текущие рейтинги
+    field_size = max(players_count or 0, len(participants))
+    if field_size < 2:
+        return {}
+    current = {player_id: ratings.get(player_id, INITIAL_RATING) for player_id in participants}
+    field_total = sum(current.values()) + (field_size - len(participants)) * INITIAL_RATING
+    opponents = field_size - 1
+
+    new_ratings = {}
+    for player_id, rating in current.items():
+        if player_id == winner_id:
+            score = 1.0
+        elif player_id == second_place_id:
+            score = (opponents - 1) / opponents
+        else:
+            # Проиграл призерам, с остальными ничья
+            score = max(opponents - 2, 0) / 2 / opponents
+        expected = _expected_score(rating, (field_total - rating) / opponents)
+        new_ratings[player_id] = rating + K_FACTOR * (score - expected)
+    return new_ratings
+
+
+def _from_point(date_column, id_column, day, game_id):
+    # Игры не раньше точки (day, game_id) в порядке (дата, id); сравнение строк идет по индексу
+    return tuple_(date_column, id_column) >= tuple_(day, game_id)
+
+
+def _latest_snapshots(session, player_ids):
+    # Последний сохраненный рейтинг каждого игрока: {player_id: (рейтинг, игр)}.
+    # Для каждого игрока — один поиск по индексу (player_id, date, game_id).
+    history = RatingSnapshot.__table__
+    state = {}
+    for player_id in player_ids:
+        row = session.execute(
+            select(history.c.rating, history.c.games).where(history.c.player_id == player_id)
+            .order_by(history.c.date.desc(), history.c.game_id.desc()).limit(1)
+        ).first()
+        if row is not None:
+            state[player_id] = tuple(row)
+    return state
+
+
+def replay_ratings(session, day=None, game_id=None, exclude_game_id=None):
+    # Пересчитывает рейтинг с игры (day, game_id) и до конца истории.
+    # Без точки — полный пересчет. exclude_game_id — удаляемая игра, она пропускается.
+    history = RatingSnapshot.__table__
+    games = PokerGame.__table__
+    links = game_players_association
+
+    affected = set()
+    if exclude_game_id is not None:
+        affected.update(session.execute(
+            select(history.c.player_id).where(history.c.game_id == exclude_game_id)
+        ).scalars())
+        session.execute(history.delete().where(history.c.game_id == exclude_game_id))
+
+    game_filters = []
+    if day is not None:
+        game_filters.append(_from_point(games.c.date, games.c.id, day, game_id))
+        session.execute(history.delete().where(_from_point(history.c.date, history.c.game_id, day, game_id)))
+    else:
+        session.execute(history.delete())
+    if exclude_game_id is not None:
+        game_filters.append(games.c.id != exclude_game_id)
+
+    replayed = session.execute(
+        select(games.c.id, games.c.date, games.c.winner_id, games.c.second_place_id, games.c.players_count)
+        .where(*game_filters).order_by(games.c.date, games.c.id)
+    ).all()
+    participants = {}
+    replayed_ids = select(games.c.id).where(*game_filters)
+    for link_game_id, player_id in session.execute(
+        select(links.c.game_id, links.c.player_id)
+        .where(links.c.game_id.in_(replayed_ids))
+        .order_by(links.c.game_id, links.c.player_id)
+    ):
+        participants.setdefault(link_game_id, []).append(player_id)
+    for player_ids in participants.values():
+        affected.update(player_ids)
+
+    # Начальное состояние — последние снимки до точки пересчета (при полном пересчете их нет)
+    state = _latest_snapshots(session, sorted(affected)) if day is not None else {}
+    ratings = {player_id: rating for player_id, (rating, _) in state.items()}
+
+    rows = []
+    for replayed_id, replayed_date, winner_id, second_place_id, players_count in replayed:
+        new_ratings = rate_game(
+            ratings, participants.get(replayed_id, []), winner_id, second_place_id, players_count
+        )
+        for player_id, rating in new_ratings.items():
+            games_played = state.get(player_id, (INITIAL_RATING, 0))[1] + 1
+            state[player_id] = (rating, games_played)
+            ratings[player_id] = rating
+            rows.append({
+                'game_id': replayed_id, 'player_id': player_id, 'date': replayed_date,
+                'rating': rating, 'games': games_played,
+            })
+    if rows:
+        session.execute(history.insert(), rows)
+
+    # Текущие рейтинги затронутых игроков — их последние снимки
+    current = PlayerRating.__table__
+    if day is not None:
+        session.execute(current.delete().where(current.c.player_id.in_(affected)))
+    else:
+        session.execute(current.delete())
+    if state:
+        session.execute(current.insert(), [
+            {'player_id': player_id, 'rating': rating, 'games': games_played}
+            for player_id, (rating, games_played) in state.items()
+            if day is None or player_id in affected
+        ])
+    return len(replayed)
+
+
+def rebuild_ratings(session):
+    return replay_ratings(session)
+
+
+def on_game_added(session, game):
+    replay_ratings(session, game.date, game.id)
+
+
+def on_game_deleted(session, game):
+    replay_ratings(session, game.date, game.id, exclude_game_id=game.id)
+
+
+game_added_hooks.append(on_game_added)
+game_deleted_hooks.append(on_game_deleted)
+
+
+def rating_leaderboard(session, limit=None):
+    # (имя, рейтинг, игр) по убыванию рейтинга
+    query = session.query(Player.name, PlayerRating.rating, PlayerRating.games)\
+        .join(Player, Player.id == PlayerRating.player_id)\
+        .order_by(PlayerRating.rating.desc(), Player.name)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def player_rating(session, player_id):
+    # (рейтинг, игр) или None, если у игрока еще нет рейтинговых игр
+    row = session.query(PlayerRating.rating, PlayerRating.games).filter(PlayerRating.player_id == player_id).first()
+    return tuple(row) if row else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Рейтинг Эло игроков")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    show = subparsers.add_parser('show', help="Показать таблицу рейтинга")
+    show.add_argument('--limit', type=int)
+    subparsers.add_parser('rebuild', help="Пересчитать рейтинг по всей истории")
+    args = parser.parse_args()
+
+    session = get_session(init_db())
+    try:
+        if args.command == 'show':
+            for i, (name, rating, games) in enumerate(rating_leaderboard(session, args.limit), 1):
+                print(f"{i}. {name}: {rating:.0f} ({games} игр)")
+            return
+
+        count = rebuild_ratings(session)
+        bump_data_generation(session)
+        session.commit()
+        print(f"Рейтинг пересчитан по {count} играм")
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import threading
+import time
+
+from sqlalchemy import DDL, event
+from telegram import ReplyKeyboardMarkup
+
+import config
+from database import City, Player, bump_roster_generation, get_roster_generation, player_renamed_hooks
+
+# Состав игроков (players.in_roster) и города (таблица cities) для клавиатур бота.
+# Бот держит их снимок в памяти: проверки выбора идут по множествам, клавиатуры
+# собираются один раз на снимок. Изменения состава увеличивают поколение в bot_meta,
+# по нему снимок обновляется без перезапуска бота.
+
+# Состав и города, которые раньше были зашиты в коде бота
+LEGACY_ROSTER = [
+    'Данила Бадецкий', 'Данил 72 Сергеев', 'Семен Попович',
+    'Слава Харьков', 'Дмитрий Бедарев', 'Дмитрий Ляпин', 'Максим Мерзлый',
+    'Максим Гомозов', 'Богдан Светоносов', 'Евгений Черницкий', 'Роман Репняков',
+    'Аня Маславская',
+]
+
+seed_cities = DDL("""
+    INSERT INTO cities (name) VALUES ('Санкт-Петербург'), ('Архангельск'), ('Выборг')
+""")
+event.listen(City.__table__, 'after_create', seed_cities)
+
+# Новая база получает прежний состав так же, как существующая получает его миграцией
+seed_roster = DDL(
+    "INSERT INTO players (name, in_roster) VALUES "
+    + ", ".join(f"('{name}', 1)" for name in LEGACY_ROSTER)
+)
+event.listen(Player.__table__, 'after_create', seed_roster)
+
+CANCEL_ROW = ['Отмена']
+# Сколько клавиатур с оставшимися участниками хранить в одном снимке
+AVAILABLE_KEYBOARDS_LIMIT = 1024
+
+
+def _keyboard(names, first_rows=()):
+    return ReplyKeyboardMarkup(
+        list(first_rows) + [[name] for name in names] + [CANCEL_ROW], resize_keyboard=True
+    )
+
+
+class Roster:
+    # Неизменяемый снимок состава и городов с готовыми клавиатурами
+
+    def __init__(self, players, cities):
+        self.players = tuple(players)
+        self.cities = tuple(cities)
+        self.player_set = frozenset(self.players)
+        self.city_set = frozenset(self.cities)
+        self.players_keyboard = _keyboard(self.players)
+        self.cities_keyboard = _keyboard(self.cities)
+        self.stats_keyboard = _keyboard(self.players, [['все']])
+        self._available = {}
+
+    def available_keyboard(self, excluded):
+        # Клавиатура игроков без уже выбранных; для каждого набора выбранных строится один раз
+        key = frozenset(excluded)
+        keyboard = self._available.get(key)
+        if keyboard is None:
+            if len(self._available) >= AVAILABLE_KEYBOARDS_LIMIT:
+                self._available.clear()
+            keyboard = self._available[key] = _keyboard([name for name in self.players if name not in key])
+        return keyboard
+
+
+def load_roster(session):
+    players = [name for (name,) in session.query(Player.name).filter(Player.in_roster.is_(True)).order_by(Player.name)]
+    cities = [name for (name,) in session.query(City.name).order_by(City.id)]
+    return Roster(players, cities)
+
+
+class RosterCache:
+    # Снимок состава в памяти процесса. С поколением в базе он сверяется не чаще
+    # раза в config.ROSTER_REFRESH_SECONDS, в остальное время запросов к базе нет.
+
+    def __init__(self):
+        self._roster = None
+        self._generation = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def cached(self):
+        # Снимок, если его еще рано сверять с базой, иначе None
+        if self._roster is not None and time.monotonic() - self._checked_at < config.ROSTER_REFRESH_SECONDS:
+            return self._roster
+        return None
+
+    def refresh(self, session):
+        generation = get_roster_generation(session)
+        with self._lock:
+            if self._roster is None or generation != self._generation:
+                self._roster = load_roster(session)
+                self._generation = generation
+            self._checked_at = time.monotonic()
+            return self._roster
+
+    def invalidate(self):
+        # Следующее обращение перечитает состав из базы
+        with self._lock:
+            self._generation = None
+            self._checked_at = 0.0
+
+
+roster_cache = RosterCache()
+
+
+def roster_changed(session):
+    # Вызывается в транзакции, которая меняет состав или города
+    bump_roster_generation(session)
+    roster_cache.invalidate()
+
+
+def on_player_renamed(session, player):
+    if player.in_roster:
+        roster_changed(session)
+
+
+player_renamed_hooks.append(on_player_renamed)
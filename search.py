@@ -0,0 +1,87 @@
+from sqlalchemy import DDL, event, text
+
+from database import Base, game_added_hooks, game_deleted_hooks, player_renamed_hooks
+
+# Полнотекстовый индекс игр (SQLite FTS5): город, описание, призеры и все участники.
+# rowid строки индекса совпадает с id игры.
+
+FTS_TABLE = 'games_fts'
+
+create_fts_table = DDL(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        city, description, winner, second_place, participants,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+""")
+
+# Виртуальную таблицу create_all сам не создает
+event.listen(Base.metadata, 'after_create', create_fts_table)
+
+
+_INDEX_GAMES = f"""
+    INSERT INTO {FTS_TABLE} (rowid, city, description, winner, second_place, participants)
+    SELECT g.id, g.city, coalesce(g.description, ''), g.winner, g.second_place,
+           coalesce((
+               SELECT group_concat(p.name, ' ')
+               FROM game_players_association a JOIN players p ON p.id = a.player_id
+               WHERE a.game_id = g.id
+           ), '')
+    FROM poker_games g
+"""
+
+
+def rebuild_search_index(connection):
+    connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    connection.execute(text(_INDEX_GAMES))
+
+
+def on_game_added(session, game):
+    session.execute(
+        text(f"""
+            INSERT INTO {FTS_TABLE} (rowid, city, description, winner, second_place, participants)
+            VALUES (:id, :city, :description, :winner, :second_place, :participants)
+        """),
+        {
+            'id': game.id,
+            'city': game.city or '',
+            'description': game.description or '',
+            'winner': game.winner or '',
+            'second_place': game.second_place or '',
+            'participants': ' '.join(player.name for player in game.players),
+        }
+    )
+
+
+def on_game_deleted(session, game):
+    session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': game.id})
+
+
+def on_player_renamed(session, player):
+    # Переиндексируются только игры, где игрок участвовал
+    player_games = "SELECT game_id FROM game_players_association WHERE player_id = :id"
+    session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({player_games})"), {'id': player.id})
+    session.execute(text(f"{_INDEX_GAMES} WHERE g.id IN ({player_games})"), {'id': player.id})
+
+
+game_added_hooks.append(on_game_added)
+game_deleted_hooks.append(on_game_deleted)
+player_renamed_hooks.append(on_player_renamed)
+
+
+def _match_query(term):
+    # Каждое слово ищется по префиксу, все слова должны встретиться в игре.
+    # Слова берутся в кавычки, чтобы пользовательский ввод не разбирался как синтаксис FTS5.
+    words = [word.replace('"', '""') for word in term.split()]
+    return ' '.join(f'"{word}"*' for word in words if word)
+
+
+def search_games(session, term, limit):
+    # id игр, отсортированные по релевантности
+    query = _match_query(term)
+    if not query:
+        return []
+    rows = session.execute(
+        text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query ORDER BY rank LIMIT :limit"),
+        {'query': query, 'limit': limit}
+    )
+    return [row[0] for row in rows]
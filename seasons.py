@@ -0,0 +1,189 @@
+import argparse
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import DDL, case, event, func, or_
+from sqlalchemy.dialects.sqlite import insert
+
+from database import (
+    init_db, get_session, bump_data_generation, season_points,
+    PokerGame, Player, Season, SeasonResult, game_players_association,
+    game_added_hooks, game_deleted_hooks,
+)
+
+# Итоги сезонов хранятся в season_results и обновляются вместе с играми, поэтому таблица
+# лидеров любого сезона — одно чтение по первичному ключу. Игры закрытого сезона больше
+# не меняются, и его итоги остаются такими, какими были на момент закрытия.
+
+# Сезоны, которые раньше были зашиты в коде бота
+seed_seasons = DDL("""
+    INSERT INTO seasons (name, start_date, end_date, win_weight, second_weight) VALUES
+        ('Лакерный', NULL, '2025-05-31', 1.0, 0.33),
+        ('Второй сезон', '2025-06-01', '2025-11-30', 1.0, 0.33)
+""")
+event.listen(Season.__table__, 'after_create', seed_seasons)
+
+RESULT_COUNTERS = ('games', 'wins', 'seconds')
+
+
+def _covering(query, day):
+    return query.filter(
+        or_(Season.start_date.is_(None), Season.start_date <= day),
+        or_(Season.end_date.is_(None), Season.end_date >= day),
+    )
+
+
+def _apply_game(session, game, sign):
+    season_ids = [row[0] for row in _covering(session.query(Season.id), game.date)]
+    if not season_ids:
+        return
+    table = SeasonResult.__table__
+    for season_id in season_ids:
+        for player in game.players:
+            statement = insert(table).values(
+                season_id=season_id,
+                player_id=player.id,
+                games=sign,
+                wins=sign * int(game.winner_id == player.id),
+                seconds=sign * int(game.second_place_id == player.id),
+            )
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.season_id, table.c.player_id],
+                set_={key: table.c[key] + statement.excluded[key] for key in RESULT_COUNTERS}
+            ))
+    if sign < 0:
+        session.execute(table.delete().where(table.c.season_id.in_(season_ids), table.c.games <= 0))
+
+
+def on_game_added(session, game):
+    _apply_game(session, game, 1)
+
+
+def on_game_deleted(session, game):
+    _apply_game(session, game, -1)
+
+
+game_added_hooks.append(on_game_added)
+game_deleted_hooks.append(on_game_deleted)
+
+
+def rebuild_season_results(session, season):
+    # Полный пересчет итогов одного сезона по играм
+    filters = []
+    if season.start_date is not None:
+        filters.append(PokerGame.date >= season.start_date)
+    if season.end_date is not None:
+        filters.append(PokerGame.date <= season.end_date)
+    rows = session.query(
+        game_players_association.c.player_id,
+        func.count(PokerGame.id),
+        func.sum(case((PokerGame.winner_id == game_players_association.c.player_id, 1), else_=0)),
+        func.sum(case((PokerGame.second_place_id == game_players_association.c.player_id, 1), else_=0)),
+    ).join(PokerGame, PokerGame.id == game_players_association.c.game_id)\
+        .filter(*filters)\
+        .group_by(game_players_association.c.player_id).all()
+
+    session.query(SeasonResult).filter(SeasonResult.season_id == season.id).delete()
+    if rows:
+        session.execute(SeasonResult.__table__.insert(), [
+            {'season_id': season.id, 'player_id': player_id, 'games': games, 'wins': wins, 'seconds': seconds}
+            for player_id, games, wins, seconds in rows
+        ])
+    return len(rows)
+
+
+def rebuild_all_season_results(session):
+    for season in session.query(Season).all():
+        rebuild_season_results(session, season)
+
+
+def list_seasons(session):
+    # Сезоны по порядку: первым идет сезон без даты начала
+    return session.query(Season).order_by(
+        Season.start_date.is_not(None), Season.start_date, Season.id
+    ).all()
+
+
+def current_season(session, today=None):
+    # Текущий сезон — последний из уже начавшихся
+    today = today or date.today()
+    return session.query(Season)\
+        .filter(or_(Season.start_date.is_(None), Season.start_date <= today))\
+        .order_by(Season.start_date.is_not(None).desc(), Season.start_date.desc(), Season.id.desc())\
+        .first()
+
+
+def season_leaderboard(session, season):
+    # (имя, очки, победы, вторые места, игры) по убыванию очков
+    rows = session.query(Player.name, SeasonResult.games, SeasonResult.wins, SeasonResult.seconds)\
+        .join(Player, Player.id == SeasonResult.player_id)\
+        .filter(SeasonResult.season_id == season.id)\
+        .order_by(SeasonResult.player_id).all()
+    leaderboard = [
+        (name, season_points(wins, seconds, games, season.win_weight, season.second_weight), wins, seconds, games)
+        for name, games, wins, seconds in rows
+    ]
+    leaderboard.sort(key=lambda row: row[1], reverse=True)
+    return leaderboard
+
+
+def season_period(season):
+    start = season.start_date.strftime('%d.%m.%Y') if season.start_date else None
+    end = season.end_date.strftime('%d.%m.%Y') if season.end_date else None
+    if start and end:
+        return f"{start}-{end}"
+    if end:
+        return f"до {end}"
+    if start:
+        return f"с {start}"
+    return "все время"
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%d.%m.%Y').date() if value and value != '-' else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сезоны и их итоги")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="Показать сезоны")
+    add = subparsers.add_parser('add', help="Добавить сезон (даты ДД.ММ.ГГГГ, '-' — без ограничения)")
+    add.add_argument('name')
+    add.add_argument('start')
+    add.add_argument('end')
+    add.add_argument('--win-weight', type=float, default=1.0)
+    add.add_argument('--second-weight', type=float, default=0.33)
+    subparsers.add_parser('rebuild', help="Пересчитать итоги всех сезонов")
+    args = parser.parse_args()
+
+    session = get_session(init_db())
+    try:
+        if args.command == 'list':
+            for season in list_seasons(session):
+                print(f"{season.name}: {season_period(season)}, веса {season.win_weight:g} / {season.second_weight:g}")
+            return
+
+        if args.command == 'add':
+            if session.query(Season).filter_by(name=args.name).first() is not None:
+                print(f"Сезон {args.name} уже есть")
+                sys.exit(1)
+            season = Season(
+                name=args.name, start_date=_parse_date(args.start), end_date=_parse_date(args.end),
+                win_weight=args.win_weight, second_weight=args.second_weight,
+            )
+            session.add(season)
+            session.flush()
+            count = rebuild_season_results(session, season)
+            print(f"Сезон {season.name} добавлен, игроков в итогах: {count}")
+        else:
+            rebuild_all_season_results(session)
+            print("Итоги сезонов пересчитаны")
+        # Кэши ответов бота должны увидеть изменения
+        bump_data_generation(session)
+        session.commit()
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
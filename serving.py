@@ -0,0 +1,84 @@
+import logging
+import secrets
+from collections import deque
+
+from telegram.ext import BaseUpdateProcessor
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    # Обновления из разных чатов обрабатываются параллельно, а обновления одного
+    # пользователя в одном чате — строго по очереди. Иначе ConversationHandler мог бы
+    # получить два сообщения одного диалога одновременно и перепутать состояния.
+    #
+    # do_process_update вызывается, когда место в семафоре базового класса уже занято.
+    # Поэтому обновление диалога, который уже обрабатывается, не ждет своей очереди
+    # на этом месте (пачка сообщений из одного чата заняла бы все места), а встает
+    # в очередь диалога и выполняется тем же вызовом, что обрабатывает диалог сейчас.
+    # Каждый диалог занимает не больше одного места.
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # ключ диалога -> очередь его необработанных обновлений
+        self._queues = {}
+
+    @staticmethod
+    def _conversation_key(update):
+        chat = getattr(update, 'effective_chat', None)
+        user = getattr(update, 'effective_user', None)
+        return (chat.id if chat else None, user.id if user else None)
+
+    async def do_process_update(self, update, coroutine):
+        key = self._conversation_key(update)
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+
+        queue = self._queues[key] = deque([coroutine])
+        try:
+            while queue:
+                try:
+                    await queue[0]
+                except Exception:
+                    # Ошибка одного обновления не должна останавливать очередь диалога
+                    logger.exception(f"Update processing failed for conversation {key}")
+                queue.popleft()
+        finally:
+            del self._queues[key]
+            # При отмене (остановка бота) оставшиеся обновления уже не выполнятся
+            for pending in queue:
+                pending.close()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def run_application(application):
+    if config.BOT_MODE != 'webhook':
+        application.run_polling()
+        return
+
+    if not config.WEBHOOK_URL:
+        raise RuntimeError("Для режима webhook нужно указать POKERBOT_WEBHOOK_URL")
+
+    # Telegram присылает секрет в заголовке X-Telegram-Bot-Api-Secret-Token каждого запроса.
+    # Если он не задан, генерируем новый: webhook все равно регистрируется заново при запуске.
+    secret_token = config.WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+    webhook_url = f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}"
+    logger.info(f"Starting webhook server on {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}, public url {webhook_url}")
+
+    # TLS завершается на прокси перед ботом, сам бот слушает обычный HTTP
+    application.run_webhook(
+        listen=config.WEBHOOK_LISTEN,
+        port=config.WEBHOOK_PORT,
+        url_path=config.WEBHOOK_PATH,
+        webhook_url=webhook_url,
+        secret_token=secret_token,
+    )
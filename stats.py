@@ -0,0 +1,145 @@
+import argparse
+import sys
+from datetime import date
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.sqlite import insert
+
+from database import (
+    init_db, get_session, PokerGame, Player, PlayerStats, game_players_association,
+    game_added_hooks, game_deleted_hooks,
+)
+
+# С этой даты для игр записываются все участники, а не только призеры
+PARTICIPANTS_REQUEST_START_DATE = date(2025, 5, 27)
+
+COUNTERS = (
+    'games_all', 'wins_all', 'seconds_all', 'bank_won_all',
+    'games_recent', 'wins_recent', 'seconds_recent', 'bank_won_recent',
+)
+
+
+def _game_deltas(game, player, sign):
+    is_winner = game.winner_id == player.id
+    is_second = game.second_place_id == player.id
+    is_recent = game.date >= PARTICIPANTS_REQUEST_START_DATE
+    deltas = {
+        'games_all': 1,
+        'wins_all': int(is_winner),
+        'seconds_all': int(is_second),
+        'bank_won_all': game.bank if is_winner else 0,
+        'games_recent': int(is_recent),
+        'wins_recent': int(is_recent and is_winner),
+        # Как и раньше в show_all_stats: второе место не учитывается, если игрок же и победил
+        'seconds_recent': int(is_recent and is_second and not is_winner),
+        'bank_won_recent': game.bank if is_recent and is_winner else 0,
+    }
+    return {key: value * sign for key, value in deltas.items()}
+
+
+def _apply_game(session, game, sign):
+    table = PlayerStats.__table__
+    for player in game.players:
+        deltas = _game_deltas(game, player, sign)
+        statement = insert(table).values(player_id=player.id, **deltas)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.player_id],
+            set_={key: table.c[key] + statement.excluded[key] for key in COUNTERS}
+        )
+        session.execute(statement)
+
+    if sign < 0:
+        # Игрок без игр пропадает из общей статистики, как и при полном пересчете
+        session.execute(table.delete().where(table.c.games_all <= 0))
+
+
+def on_game_added(session, game):
+    _apply_game(session, game, 1)
+
+
+def on_game_deleted(session, game):
+    _apply_game(session, game, -1)
+
+
+game_added_hooks.append(on_game_added)
+game_deleted_hooks.append(on_game_deleted)
+
+
+def compute_rollup(session):
+    # Полный пересчет статистики по всем играм: {player_id: {счетчик: значение}}
+    is_winner = PokerGame.winner_id == Player.id
+    is_second = PokerGame.second_place_id == Player.id
+    is_recent = PokerGame.date >= PARTICIPANTS_REQUEST_START_DATE
+    rows = session.query(
+        Player.id,
+        func.count(PokerGame.id),
+        func.sum(case((is_winner, 1), else_=0)),
+        func.sum(case((is_second, 1), else_=0)),
+        func.sum(case((is_winner, PokerGame.bank), else_=0)),
+        func.sum(case((is_recent, 1), else_=0)),
+        func.sum(case((is_recent & is_winner, 1), else_=0)),
+        func.sum(case((is_recent & is_second & ~is_winner, 1), else_=0)),
+        func.sum(case((is_recent & is_winner, PokerGame.bank), else_=0)),
+    ).join(game_players_association, game_players_association.c.player_id == Player.id)\
+        .join(PokerGame, PokerGame.id == game_players_association.c.game_id)\
+        .group_by(Player.id).all()
+    return {row[0]: dict(zip(COUNTERS, row[1:])) for row in rows}
+
+
+def rebuild_rollup(session):
+    rollup = compute_rollup(session)
+    session.query(PlayerStats).delete()
+    if rollup:
+        session.execute(PlayerStats.__table__.insert(), [
+            {'player_id': player_id, **counters} for player_id, counters in rollup.items()
+        ])
+    return len(rollup)
+
+
+def verify_rollup(session):
+    # Возвращает список расхождений между player_stats и полным пересчетом
+    expected = compute_rollup(session)
+    actual = {
+        row.player_id: {key: getattr(row, key) for key in COUNTERS}
+        for row in session.query(PlayerStats).all()
+    }
+    problems = []
+    for player_id in sorted(set(expected) | set(actual)):
+        want = expected.get(player_id)
+        have = actual.get(player_id)
+        if want is None or have is None:
+            problems.append((player_id, want, have))
+            continue
+        for key in COUNTERS:
+            if abs((want[key] or 0) - (have[key] or 0)) > 1e-6:
+                problems.append((player_id, want, have))
+                break
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Таблица накопленной статистики игроков")
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    args = parser.parse_args()
+
+    session = get_session(init_db())
+    try:
+        if args.command == 'rebuild':
+            count = rebuild_rollup(session)
+            session.commit()
+            print(f"Статистика пересчитана для {count} игроков")
+            return
+
+        problems = verify_rollup(session)
+        for player_id, want, have in problems:
+            print(f"Игрок {player_id}: ожидалось {want}, в таблице {have}")
+        if problems:
+            print(f"Расхождений: {len(problems)}. Исправить: python stats.py rebuild")
+            sys.exit(1)
+        print("Статистика совпадает с полным пересчетом")
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
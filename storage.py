@@ -0,0 +1,40 @@
+from sqlalchemy import event
+
+import config
+
+# Настройки SQLite, которые задаются на каждом новом соединении пула.
+# WAL позволяет читать базу, пока другое соединение пишет (например, add_description),
+# synchronous=NORMAL в режиме WAL не теряет целостность и не ждет fsync на каждой транзакции.
+
+
+def sqlite_pragmas():
+    # (имя, значение) в порядке применения; пустые значения пропускаются
+    pragmas = [
+        ('journal_mode', config.DB_JOURNAL_MODE),
+        ('synchronous', config.DB_SYNCHRONOUS),
+        ('cache_size', config.DB_CACHE_SIZE),
+        ('mmap_size', config.DB_MMAP_SIZE),
+        ('busy_timeout', config.DB_BUSY_TIMEOUT),
+        # SQLite проверяет внешние ключи (и выполняет ON DELETE CASCADE), только если это включено
+        ('foreign_keys', 'ON'),
+    ]
+    return [(name, value) for name, value in pragmas if value not in (None, '')]
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def is_file_database(engine):
+    return engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:')
+
+
+def configure_sqlite(engine):
+    if engine.dialect.name != 'sqlite':
+        return
+    event.listen(engine, 'connect', _apply_pragmas)
@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+from telegram.request import BaseRequest
+
+# Тесты работают с временной базой: настройки читаются из окружения при импорте config,
+# поэтому задаются до импорта модулей бота
+_directory = tempfile.mkdtemp(prefix='pokerbot-tests-')
+os.environ['POKERBOT_DB_URL'] = f"sqlite:///{os.path.join(_directory, 'poker_games.db')}"
+os.environ['POKERBOT_CHART_WORKERS'] = '0'
+os.environ['POKERBOT_METRICS_PORT'] = '0'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubRequest(BaseRequest):
+    # Заглушка Bot API: отвечает локально; on_send(метод) вызывается на каждый send*
+    def __init__(self, on_send=None):
+        self.on_send = on_send
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'pokerbot', 'username': 'pokerbot'}
+        elif api_method.startswith('send'):
+            if self.on_send is not None:
+                self.on_send(api_method)
+            self._message_id += 1
+            result = {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(parameters.get('chat_id', 0)), 'type': 'private'},
+            }
+            if api_method == 'sendPhoto':
+                result['photo'] = [{'file_id': f'photo{self._message_id}', 'file_unique_id': 'u', 'width': 1, 'height': 1}]
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def _fake_update(update_id, chat_id, text):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+@pytest.fixture(scope='session', autouse=True)
+def bot_database():
+    # bot.py не трогает базу при импорте, схему создает build_application; в тестах — здесь
+    import bot
+    from migrations import migrate
+    migrate(bot.engine)
+    return bot.engine
+
+
+@pytest.fixture
+def stub_application():
+    # stub_application(on_send=None) — приложение с заглушкой Bot API (использовать в async with)
+    from telegram.ext import Application
+
+    def build(on_send=None):
+        return Application.builder().token('1:test').request(StubRequest(on_send))\
+            .get_updates_request(StubRequest()).build()
+    return build
+
+
+@pytest.fixture
+def handler_call():
+    # handler_call(application, update_id, chat_id, text) -> (update, context) для прямого вызова обработчика
+    from telegram import Update
+    from telegram.ext import CallbackContext
+
+    def build(application, update_id, chat_id, text):
+        update = Update.de_json(_fake_update(update_id, chat_id, text), application.bot)
+        return update, CallbackContext.from_update(update, application)
+    return build
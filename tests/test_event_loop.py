@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+import bot
+
+# Долгий запрос статистики выполняется в пуле потоков базы и не задерживает ответы другим чатам
+
+SLOW_QUERY_SECONDS = 1.0
+START_REPLY_LIMIT = 0.3
+
+
+async def _start_during_slow_stats(application, handler_call):
+    async with application:
+        slow = asyncio.create_task(bot.show_all_stats(*handler_call(application, 1, 1, 'все')))
+        # Даем долгому запросу начаться
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        await bot.start(*handler_call(application, 2, 2, '/start'))
+        elapsed = time.perf_counter() - started
+        slow_done = slow.done()
+        await slow
+    return elapsed, slow_done
+
+
+def test_start_is_not_delayed_by_slow_stats_query(monkeypatch, stub_application, handler_call):
+    # Запрос общей статистики настоящего обработчика становится долгим
+    all_stats_response = bot._all_stats_response
+
+    def slow_all_stats_response(session):
+        time.sleep(SLOW_QUERY_SECONDS)
+        return all_stats_response(session)
+
+    monkeypatch.setattr(bot, '_all_stats_response', slow_all_stats_response)
+    bot.response_cache.clear()
+    elapsed, slow_done = asyncio.run(_start_during_slow_stats(stub_application(), handler_call))
+    assert not slow_done
+    assert elapsed < START_REPLY_LIMIT
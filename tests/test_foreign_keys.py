@@ -0,0 +1,41 @@
+from datetime import date
+
+from sqlalchemy import create_engine
+
+from database import PokerGame, Player, RatingSnapshot, add_game, get_session
+from migrations import migrate
+from storage import configure_sqlite
+
+
+def _rated_game(session):
+    winner, second = session.query(Player).filter(Player.in_roster.is_(True)).order_by(Player.id).limit(2)
+    game = PokerGame(
+        date=date(2024, 5, 1), city='Выборг', players_count=2,
+        winner=winner.name, winner_id=winner.id, second_place=second.name, second_place_id=second.id,
+        rebuys=0, bank=200.0, buyin=100.0, big_blind=20, players=[winner, second],
+    )
+    add_game(session, game)
+    session.commit()
+    return game.id
+
+
+def test_raw_delete_of_rated_game_removes_its_rows(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'poker_games.db'}")
+    configure_sqlite(engine)
+    migrate(engine)
+    session = get_session(engine)
+    try:
+        game_id = _rated_game(session)
+        assert session.query(RatingSnapshot).filter_by(game_id=game_id).count() == 2
+
+        # Удаление в обход delete_game: внешние ключи не мешают, связи и снимки удаляются каскадом
+        session.connection().exec_driver_sql("DELETE FROM poker_games WHERE id = ?", (game_id,))
+        session.commit()
+
+        assert session.query(RatingSnapshot).filter_by(game_id=game_id).count() == 0
+        assert not session.connection().exec_driver_sql(
+            "SELECT 1 FROM game_players_association WHERE game_id = ?", (game_id,)).fetchall()
+        assert not session.connection().exec_driver_sql("PRAGMA foreign_key_check").fetchall()
+    finally:
+        session.close()
+        engine.dispose()
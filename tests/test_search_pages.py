@@ -0,0 +1,38 @@
+from datetime import date
+
+import bot
+from database import PokerGame, Player, add_game, get_session
+
+
+def test_pages_fit_the_limit_and_break_between_lines():
+    lines = [f"*строка {i}* " + 'x' * 30 for i in range(40)]
+    block = '\n'.join(lines)
+    pages = bot._pack_messages(['🎲 *Информация об игре*', block], limit=200)
+    assert all(len(page) <= 200 for page in pages)
+    # Ни одна строка с разметкой не разрезана
+    assert sorted(line for page in pages for line in page.split('\n')) == sorted(['🎲 *Информация об игре*'] + lines)
+
+
+def test_long_line_is_not_cut_inside_an_escape():
+    line = ('a' * 9 + '\\_') * 30
+    pages = bot._pack_messages([line], limit=50)
+    assert all(len(page) <= 50 and not page.endswith('\\') for page in pages)
+    assert ''.join(pages) == line
+
+
+def test_description_markup_is_escaped():
+    session = get_session(bot.engine)
+    try:
+        winner, second = session.query(Player).filter(Player.in_roster.is_(True)).order_by(Player.id).limit(2)
+        add_game(session, PokerGame(
+            date=date(2024, 3, 8), city='Выборг', players_count=2,
+            winner=winner.name, winner_id=winner.id, second_place=second.name, second_place_id=second.id,
+            rebuys=0, bank=200.0, buyin=100.0, big_blind=20, description='all-in *на ривере_',
+            players=[winner, second],
+        ))
+        session.flush()
+        [response] = bot._search_game_responses(session, '08.03.2024')
+        session.rollback()
+    finally:
+        session.close()
+    assert '📝 Описание: all-in \\*на ривере\\_' in response
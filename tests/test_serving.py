@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+from serving import PerChatUpdateProcessor
+
+
+def _update(chat_id):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=SimpleNamespace(id=chat_id))
+
+
+async def _burst_from_one_chat():
+    processor = PerChatUpdateProcessor(2)
+    release = asyncio.Event()
+    order = []
+
+    async def slow(index):
+        order.append(('busy', index))
+        await release.wait()
+
+    async def quick():
+        order.append(('other chat', processor.current_concurrent_updates))
+
+    # Пять обновлений одного чата: первое занято, остальные ждут очереди диалога
+    busy = [asyncio.create_task(processor.process_update(_update(1), slow(i))) for i in range(5)]
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(processor.process_update(_update(2), quick()), timeout=1)
+    release.set()
+    await asyncio.gather(*busy)
+    return order, processor.current_concurrent_updates
+
+
+def test_burst_from_one_chat_does_not_block_other_chats():
+    order, active = asyncio.run(_burst_from_one_chat())
+    # Другой чат обработан, пока первое обновление пачки еще идет, и занял второе место
+    assert order[:2] == [('busy', 0), ('other chat', 2)]
+    assert [item for item in order if item[0] == 'busy'] == [('busy', i) for i in range(5)]
+    assert active == 0
+
+
+async def _failing_update_then_next():
+    processor = PerChatUpdateProcessor(2)
+    release = asyncio.Event()
+    done = []
+
+    async def failing():
+        await release.wait()
+        raise RuntimeError("сбой обработчика")
+
+    async def next_update():
+        done.append('next')
+
+    first = asyncio.create_task(processor.process_update(_update(1), failing()))
+    await asyncio.sleep(0.01)
+    await processor.process_update(_update(1), next_update())
+    release.set()
+    await first
+    return done
+
+
+def test_failed_update_does_not_stop_the_conversation_queue():
+    assert asyncio.run(_failing_update_then_next()) == ['next']
@@ -0,0 +1,19 @@
+import asyncio
+
+import bot
+
+
+async def _replies_pool_usage(stub_application, handler_call, handler, text):
+    # Сколько соединений пула занято в момент каждого вызова Bot API
+    checked_out = []
+    application = stub_application(lambda method: checked_out.append(bot.engine.pool.checkedout()))
+    async with application:
+        bot.response_cache.clear()
+        await handler(*handler_call(application, 1, 1, text))
+    return checked_out
+
+
+def test_connection_is_released_before_bot_api_calls(stub_application, handler_call):
+    for handler, text in [(bot.show_recent_games, 'Последние игры'), (bot.show_all_stats, 'все')]:
+        checked_out = asyncio.run(_replies_pool_usage(stub_application, handler_call, handler, text))
+        assert checked_out and all(count == 0 for count in checked_out), (handler.__name__, checked_out)